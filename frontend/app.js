@@ -407,6 +407,7 @@ async function searchTicker() {
             method: 'GET',
             headers: {
                 'Content-Type': 'application/json',
+                'Accept': 'application/json',
                 'X-Api-Key': API_KEY
             }
         });
@@ -1,29 +1,103 @@
 import os
-import json
+import orjson
 import boto3
+from botocore.config import Config
 import time
 import re
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-athena_client = boto3.client('athena')
-s3_client = boto3.client('s3')
+boto_config = Config(
+    retries={'max_attempts': 4, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    connect_timeout=1,
+    read_timeout=3
+)
+
+athena_client = boto3.client('athena', config=boto_config)
 
 ATHENA_DATABASE = os.environ.get("ATHENA_DATABASE", "altdata_sentiment_db")
 ATHENA_TABLE = os.environ.get("ATHENA_TABLE", "reddit_posts")
 ATHENA_OUTPUT_BUCKET = os.environ.get("ATHENA_OUTPUT_BUCKET")
 KEYWORDS = os.environ.get("KEYWORDS")
+RESULT_REUSE_MAX_AGE_MINUTES = int(os.environ.get("RESULT_REUSE_MAX_AGE_MINUTES", "60"))
+
+# Athena polling backoff (seconds)
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 2.0
+POLL_BACKOFF_FACTOR = 1.5
 
-VALID_CONTENT_TYPES = {'all', 'posts', 'comments'}
+VALID_CONTENT_TYPES = frozenset({'all', 'posts', 'comments'})
 MAX_TICKER_LENGTH = 10
 TICKER_PATTERN = re.compile(r'^[A-Z]{1,10}$')
-ALLOWED_ORIGINS = [
+SANITIZE_TABLE = str.maketrans('', '', '\'";\\-')
+ALLOWED_ORIGINS = frozenset([
     'http://localhost:3000', 
     'https://altdata-sentiment-dashboard-website.s3-website-us-east-1.amazonaws.com',
     'http://altdata-sentiment-dashboard-website.s3-website-us-east-1.amazonaws.com'
-] 
+])
+
+# CORS headers are precomputed per allowed origin; callers must not mutate them
+DEFAULT_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Api-Key',
+    'Content-Type': 'application/json'
+}
+ORIGIN_CORS_HEADERS = {
+    origin: {**DEFAULT_CORS_HEADERS, 'Access-Control-Allow-Origin': origin}
+    for origin in ALLOWED_ORIGINS
+}
+
+# Tickers come from the environment (set in AWS Lambda console) and are static
+# for the container lifetime, so the response body is encoded once at import
+if KEYWORDS:
+    TICKERS_LIST = [ticker.strip() for ticker in KEYWORDS.split(',') if ticker.strip()]
+    TICKERS_METADATA = {
+        "source": "lambda_environment",
+        "count": len(TICKERS_LIST)
+    }
+else:
+    # Fallback tickers with a warning
+    TICKERS_LIST = ['AAPL', 'TSLA', 'AMZN', 'GOOGL', 'MSFT']
+    TICKERS_METADATA = {
+        "source": "fallback_default",
+        "count": len(TICKERS_LIST),
+        "warning": "KEYWORDS environment variable not set, using fallback"
+    }
+
+# Encoded body minus the closing braces of "metadata" and the top-level object,
+# so only the per-request timestamp has to be appended
+TICKERS_BODY_PREFIX = orjson.dumps({"tickers": TICKERS_LIST, "metadata": TICKERS_METADATA}).decode()[:-2]
+
+# WHERE fragments and query templates, built once per container
+TICKER_WHERE = "(regexp_like(title, ?) OR regexp_like(selftext, ?))"
+CONTENT_TYPE_WHERE = {
+    'all': None,
+    'posts': "type = 'post'",
+    'comments': "type = 'comment'"
+}
+
+TREND_QUERY_TEMPLATE = f"""
+    SELECT date(from_unixtime(created_utc)) AS post_date, sentiment.sentiment AS sentiment_type, COUNT(*) as post_count
+    FROM {ATHENA_TABLE} WHERE {{where_clause}}
+    GROUP BY 1, 2 ORDER BY 1 DESC
+"""
+
+POSTS_QUERY_TEMPLATE = f"""
+    SELECT
+        CASE
+            WHEN type = 'post' THEN title
+            WHEN type = 'comment' THEN body
+        END AS display_text,
+        subreddit, sentiment.sentiment AS sentiment_type, url, type
+    FROM {ATHENA_TABLE} WHERE {{where_clause}}
+    ORDER BY created_utc DESC LIMIT 20
+"""
 
 def validate_ticker(ticker):
     if not ticker or ticker == 'ALL':
@@ -41,21 +115,10 @@ def sanitize_input(input_str):
     if not input_str:
         return ""
     
-    sanitized = re.sub(r'[\'";\\-]', '', input_str)
-    return sanitized.strip()
+    return input_str.translate(SANITIZE_TABLE).strip()
 
 def get_cors_headers(origin):
-    allowed_origin = '*'
-    
-    if origin in ALLOWED_ORIGINS:
-        allowed_origin = origin
-    
-    return {
-        'Access-Control-Allow-Origin': allowed_origin,
-        'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Api-Key',
-        'Content-Type': 'application/json'
-    }
+    return ORIGIN_CORS_HEADERS.get(origin, DEFAULT_CORS_HEADERS)
 
 def lambda_handler(event, context):
     logger.info(f"Received event: {event}")
@@ -84,7 +147,7 @@ def lambda_handler(event, context):
             return {
                 'statusCode': 400,
                 'headers': cors_headers,
-                'body': json.dumps({'error': 'Invalid ticker format. Use 1-10 uppercase letters.'})
+                'body': orjson.dumps({'error': 'Invalid ticker format. Use 1-10 uppercase letters.'}).decode()
             }
         
         if not validate_content_type(content_type):
@@ -92,7 +155,7 @@ def lambda_handler(event, context):
             return {
                 'statusCode': 400,
                 'headers': cors_headers,
-                'body': json.dumps({'error': 'Invalid content type. Use: all, posts, or comments.'})
+                'body': orjson.dumps({'error': 'Invalid content type. Use: all, posts, or comments.'}).decode()
             }
         
         ticker = sanitize_input(ticker.upper()) if ticker != 'ALL' else 'ALL'
@@ -101,43 +164,34 @@ def lambda_handler(event, context):
         logger.info(f"Querying data for ticker: {ticker}, type: {content_type}")
 
         where_conditions = ["1=1"]
+        execution_params = None
         
         if ticker != 'ALL':
-            where_conditions.append(f"(UPPER(title) LIKE UPPER('%{ticker}%') OR UPPER(selftext) LIKE UPPER('%{ticker}%'))")
+            # Ticker is bound via execution parameters so the query text stays constant
+            where_conditions.append(TICKER_WHERE)
+            # Case-insensitive whole-word match, so e.g. 'AMD' no longer matches 'DAMDOWN'
+            ticker_pattern = f"'(?i)\\b{ticker}\\b'"
+            execution_params = [ticker_pattern, ticker_pattern]
 
-        if content_type == 'posts':
-            where_conditions.append("type = 'post'")
-        elif content_type == 'comments':
-            where_conditions.append("type = 'comment'")
+        content_type_where = CONTENT_TYPE_WHERE[content_type]
+        if content_type_where:
+            where_conditions.append(content_type_where)
         
         where_clause = " AND ".join(where_conditions)
 
-        trend_query = f"""
-            SELECT date(from_unixtime(created_utc)) AS post_date, sentiment.sentiment AS sentiment_type, COUNT(*) as post_count
-            FROM {ATHENA_TABLE} WHERE {where_clause}
-            GROUP BY 1, 2 ORDER BY 1 DESC
-        """
-
-        posts_query = f"""
-            SELECT
-                CASE
-                    WHEN type = 'post' THEN title
-                    WHEN type = 'comment' THEN body
-                END AS display_text,
-                subreddit, sentiment.sentiment AS sentiment_type, url, type
-            FROM {ATHENA_TABLE} WHERE {where_clause}
-            ORDER BY created_utc DESC LIMIT 20
-        """
-
-        logger.info("Executing trend data query...")
-        trend_results = execute_athena_query(trend_query)
-        
-        logger.info("Executing posts data query...")
-        posts_results = execute_athena_query(posts_query)
+        trend_query = TREND_QUERY_TEMPLATE.format(where_clause=where_clause)
+        posts_query = POSTS_QUERY_TEMPLATE.format(where_clause=where_clause)
+
+        logger.info("Executing trend and posts data queries...")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            trend_future = executor.submit(execute_athena_query, trend_query, execution_params)
+            posts_future = executor.submit(execute_athena_query, posts_query, execution_params)
+            trend_results = trend_future.result()
+            posts_results = posts_future.result()
 
         final_response = {
-            "trend_data": trend_results,
-            "posts_data": posts_results,
+            "trend_data": columns_to_records(trend_results),
+            "posts_data": columns_to_records(posts_results),
             "metadata": {
                 "ticker": ticker,
                 "content_type": content_type,
@@ -149,7 +203,7 @@ def lambda_handler(event, context):
         return {
             'statusCode': 200,
             'headers': cors_headers,
-            'body': json.dumps(final_response)
+            'body': orjson.dumps(final_response).decode()
         }
 
     except ValueError as ve:
@@ -157,33 +211,44 @@ def lambda_handler(event, context):
         return {
             'statusCode': 400,
             'headers': cors_headers,
-            'body': json.dumps({'error': f"Validation error: {str(ve)}"})
+            'body': orjson.dumps({'error': f"Validation error: {str(ve)}"}).decode()
         }
     except Exception as e:
         logger.error(f"Unexpected error: {e}", exc_info=True)
         return {
             'statusCode': 500,
             'headers': cors_headers,
-            'body': json.dumps({'error': 'Internal server error. Please try again later.'})
+            'body': orjson.dumps({'error': 'Internal server error. Please try again later.'}).decode()
         }
 
-def execute_athena_query(query):
+def execute_athena_query(query, params=None):
     if not query.strip():
         raise ValueError("Query cannot be empty")
         
     logger.info(f"Executing Athena query: {query[:100]}...")
     
     try:
-        response = athena_client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': ATHENA_DATABASE},
-            ResultConfiguration={'OutputLocation': f's3://{ATHENA_OUTPUT_BUCKET}/query-results/'}
-        )
+        request = {
+            'QueryString': query,
+            'QueryExecutionContext': {'Database': ATHENA_DATABASE},
+            'ResultConfiguration': {'OutputLocation': f's3://{ATHENA_OUTPUT_BUCKET}/query-results/'},
+            'ResultReuseConfiguration': {
+                'ResultReuseByAgeConfiguration': {
+                    'Enabled': True,
+                    'MaxAgeInMinutes': RESULT_REUSE_MAX_AGE_MINUTES
+                }
+            }
+        }
+        if params:
+            request['ExecutionParameters'] = params
+
+        response = athena_client.start_query_execution(**request)
         query_execution_id = response['QueryExecutionId']
         logger.info(f"Started query execution with ID: {query_execution_id}")
 
         max_wait_time = 60
         wait_time = 0
+        delay = POLL_INITIAL_DELAY
         while wait_time < max_wait_time:
             stats = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
             status = stats['QueryExecution']['Status']['State']
@@ -191,8 +256,9 @@ def execute_athena_query(query):
             if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
                 break
                 
-            time.sleep(1)
-            wait_time += 1
+            time.sleep(delay)
+            wait_time += delay
+            delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
 
         if wait_time >= max_wait_time:
             raise Exception(f"Athena query timed out after {max_wait_time} seconds")
@@ -202,71 +268,54 @@ def execute_athena_query(query):
             logger.error(f"Athena query failed: {error_reason}")
             raise Exception(f"Athena query failed: {error_reason}")
 
-        result_key = f"query-results/{query_execution_id}.csv"
-        logger.info(f"Fetching results from S3: {result_key}")
-        
-        result_response = s3_client.get_object(Bucket=ATHENA_OUTPUT_BUCKET, Key=result_key)
-        result_data = result_response['Body'].read().decode('utf-8').splitlines()
+        logger.info(f"Fetching results for query execution: {query_execution_id}")
+
+        paginator = athena_client.get_paginator('get_query_results')
+        pages = paginator.paginate(QueryExecutionId=query_execution_id)
+
+        headers = None
+        columns = {}
 
-        if not result_data:
+        for page in pages:
+            for row in page['ResultSet']['Rows']:
+                values = [col.get('VarCharValue', '') for col in row['Data']]
+                if headers is None:
+                    headers = values
+                    columns = {header: [] for header in headers}
+                    continue
+
+                for header, value in zip(headers, values):
+                    columns[header].append(value)
+
+        if headers is None:
             logger.warning("Query returned no data")
-            return []
-            
-        headers = [h.strip('"') for h in result_data[0].split(',')]
-        parsed_results = []
+            return {}
         
-        for i, row in enumerate(result_data[1:], 1):
-            if not row.strip():
-                continue
-                
-            try:
-                values = [v.strip('"') for v in row.split(',')]
-                if len(values) == len(headers):
-                    parsed_results.append(dict(zip(headers, values)))
-                else:
-                    logger.warning(f"Row {i} has {len(values)} values but {len(headers)} headers expected")
-            except Exception as row_error:
-                logger.warning(f"Error parsing row {i}: {row_error}")
-                continue
-        
-        logger.info(f"Successfully parsed {len(parsed_results)} rows from Athena results")
-        return parsed_results
+        row_count = len(columns[headers[0]]) if headers else 0
+        logger.info(f"Successfully parsed {row_count} rows from Athena results")
+        return columns
         
     except Exception as e:
         logger.error(f"Error executing Athena query: {e}")
         raise
 
+def columns_to_records(columns):
+    """Convert column-oriented query results into the list-of-dicts shape returned by the API."""
+    if not columns:
+        return []
+
+    headers = list(columns)
+    return [dict(zip(headers, values)) for values in zip(*columns.values())]
+
 def handle_tickers_endpoint(cors_headers):
     try:
-        # Get tickers from environment variable (set in AWS Lambda console)
-        if not KEYWORDS:
-            # Return fallback tickers with a warning
-            tickers_list = ['AAPL', 'TSLA', 'AMZN', 'GOOGL', 'MSFT']
-            response = {
-                "tickers": tickers_list,
-                "metadata": {
-                    "source": "fallback_default",
-                    "timestamp": int(time.time()),
-                    "count": len(tickers_list),
-                    "warning": "KEYWORDS environment variable not set, using fallback"
-                }
-            }
-        else:
-            tickers_list = [ticker.strip() for ticker in KEYWORDS.split(',') if ticker.strip()]
-            response = {
-                "tickers": tickers_list,
-                "metadata": {
-                    "source": "lambda_environment",
-                    "timestamp": int(time.time()),
-                    "count": len(tickers_list)
-                }
-            }
+        body = f'{TICKERS_BODY_PREFIX},"timestamp":{int(time.time())}}}}}'
         
-        logger.info(f"Returning {len(tickers_list)} tickers: {tickers_list}")
+        logger.info(f"Returning {len(TICKERS_LIST)} tickers: {TICKERS_LIST}")
         return {
             'statusCode': 200,
             'headers': cors_headers,
-            'body': json.dumps(response)
+            'body': body
         }
         
     except Exception as e:
@@ -274,5 +323,5 @@ def handle_tickers_endpoint(cors_headers):
         return {
             'statusCode': 500,
             'headers': cors_headers,
-            'body': json.dumps({'error': 'Failed to retrieve tickers'})
-        }
\ No newline at end of file
+            'body': orjson.dumps({'error': 'Failed to retrieve tickers'}).decode()
+        }
@@ -1,19 +1,38 @@
 import os
-import json
+import orjson
 import boto3
+from botocore.config import Config
+import time
 import csv
 import io
+import tempfile
 from datetime import datetime
 import urllib.parse
 
-s3_client = boto3.client("s3")
-athena_client = boto3.client("athena")
+boto_config = Config(
+    retries={"max_attempts": 4, "mode": "adaptive"},
+    tcp_keepalive=True,
+    max_pool_connections=10,
+    # Batch job: pages large Athena results and multipart-uploads to S3, so allow slow responses
+    connect_timeout=5,
+    read_timeout=60
+)
+
+s3_client = boto3.client("s3", config=boto_config)
+athena_client = boto3.client("athena", config=boto_config)
 
 PROCESSED_BUCKET_NAME = os.environ.get("PROCESSED_BUCKET_NAME")
 TRAINING_DATA_BUCKET = os.environ.get("TRAINING_DATA_BUCKET")
 ATHENA_DATABASE = os.environ.get("ATHENA_DATABASE", "altdata_sentiment_db")
 ATHENA_OUTPUT_BUCKET = os.environ.get("ATHENA_OUTPUT_BUCKET")
 MAX_POSTS_PER_EXTRACTION = int(os.environ.get("MAX_POSTS_PER_EXTRACTION", "1000"))
+MIN_TEXT_LENGTH = 50  # Minimum trimmed length of the labeled text
+EXPECTED_COLUMN_COUNT = 11  # Columns selected by the extraction query
+
+# Athena polling backoff (seconds)
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 2.0
+POLL_BACKOFF_FACTOR = 1.5
 
 def lambda_handler(event, context):
     """
@@ -32,8 +51,10 @@ def lambda_handler(event, context):
         query = f"""
         SELECT 
             id,
-            title,
-            body,
+            CASE
+                WHEN type = 'post' THEN title
+                WHEN type = 'comment' THEN body
+            END AS display_text,
             subreddit,
             score,
             type,
@@ -49,6 +70,7 @@ def lambda_handler(event, context):
                 (type = 'post' AND LENGTH(title) >= {min_length})
                 OR (type = 'comment' AND LENGTH(body) >= {min_length})
             )
+            AND LENGTH(TRIM(CASE WHEN type = 'post' THEN title ELSE body END)) >= {MIN_TEXT_LENGTH}
             AND sentiment.sentiment IS NOT NULL
         ORDER BY score DESC, created_utc DESC
         LIMIT {limit}
@@ -78,18 +100,18 @@ def lambda_handler(event, context):
         
         return {
             "statusCode": 200,
-            "body": json.dumps({
+            "body": orjson.dumps({
                 "message": f"Extracted {len(training_data)} posts for labeling",
                 "s3_location": f"s3://{TRAINING_DATA_BUCKET}/{filename}",
                 "filename": filename
-            })
+            }).decode()
         }
         
     except Exception as e:
         print(f"Error in data extraction: {str(e)}")
         return {
             "statusCode": 500,
-            "body": json.dumps({"error": str(e)})
+            "body": orjson.dumps({"error": str(e)}).decode()
         }
 
 def execute_athena_query(query):
@@ -105,11 +127,11 @@ def execute_athena_query(query):
 
 def get_athena_results(query_execution_id):
     """Wait for query completion and get results"""
-    import time
     
     # Wait for query completion
     max_wait_time = 300  # 5 minutes
     wait_time = 0
+    delay = POLL_INITIAL_DELAY
     
     while wait_time < max_wait_time:
         response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
@@ -120,22 +142,29 @@ def get_athena_results(query_execution_id):
         elif status in ['FAILED', 'CANCELLED']:
             raise Exception(f"Athena query {status}: {response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')}")
         
-        time.sleep(5)
-        wait_time += 5
+        time.sleep(delay)
+        wait_time += delay
+        delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
     
     if wait_time >= max_wait_time:
         raise Exception("Athena query timed out")
     
-    # Get query results
+    # Get query results across all pages (Athena returns at most 1000 rows per page)
     results = []
-    response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-    
-    # Skip header row
-    rows = response['ResultSet']['Rows'][1:]
+    paginator = athena_client.get_paginator('get_query_results')
+    first_page = True
     
-    for row in rows:
-        data = [col.get('VarCharValue', '') for col in row['Data']]
-        results.append(data)
+    for page in paginator.paginate(QueryExecutionId=query_execution_id):
+        rows = page['ResultSet']['Rows']
+        
+        # Skip header row, which only appears on the first page
+        if first_page:
+            rows = rows[1:]
+            first_page = False
+        
+        for row in rows:
+            data = [col.get('VarCharValue', '') for col in row['Data']]
+            results.append(data)
     
     return results
 
@@ -143,33 +172,29 @@ def prepare_training_data(athena_results):
     """Convert Athena results to training data format"""
     training_data = []
     
-    for row in athena_results:
-        try:
-            post_id, title, body, subreddit, score, post_type, created_utc = row[:7]
-            sentiment_data = row[7:11]  # sentiment label and scores
-            
-            # Determine the text to analyze
-            if post_type == 'post':
-                text = title or ""
-            else:  # comment
-                text = body or ""
-            
-            # Skip if no text
-            if not text or len(text.strip()) < 50:
-                continue
+    # Every row shares the query's schema, so malformed rows are dropped once up front
+    rows = [row for row in athena_results if len(row) >= EXPECTED_COLUMN_COUNT]
+    if len(rows) != len(athena_results):
+        print(f"Skipping {len(athena_results) - len(rows)} rows with fewer than {EXPECTED_COLUMN_COUNT} columns")
+    
+    i = 0
+    try:
+        for i, row in enumerate(rows):
+            # Row layout: id, display_text, subreddit, score, type, created_utc,
+            # sentiment_label, then the four sentiment scores (unused here)
             
-            # Clean and prepare text
-            text = clean_text(text)
+            # Clean and prepare text (type selection and length filter are done in SQL)
+            text = clean_text(row[1])
             
             # Create training data entry
             training_entry = {
-                'id': post_id,
+                'id': row[0],
                 'text': text,
-                'subreddit': subreddit,
-                'type': post_type,
-                'score': score,
-                'created_utc': created_utc,
-                'existing_sentiment': sentiment_data[0] if sentiment_data[0] else 'UNKNOWN',
+                'subreddit': row[2],
+                'type': row[4],
+                'score': row[3],
+                'created_utc': row[5],
+                'existing_sentiment': row[6] or 'UNKNOWN',
                 'informative_emotional_label': '',  # To be filled during labeling
                 'labeler': '',  # To be filled during labeling
                 'labeling_notes': ''  # To be filled during labeling
@@ -177,20 +202,17 @@ def prepare_training_data(athena_results):
             
             training_data.append(training_entry)
             
-        except Exception as e:
-            print(f"Error processing row: {e}")
-            continue
+    except Exception as e:
+        print(f"Error processing row {i}: {e}")
+        raise
     
     return training_data
 
 def clean_text(text):
     """Clean text for training data"""
-    # Remove excessive whitespace
+    # Collapse all whitespace (including \n, \r, \t) to single spaces
     text = ' '.join(text.split())
     
-    # Remove or replace problematic characters
-    text = text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
-    
     # Limit length for manageable labeling
     if len(text) > 1000:
         text = text[:1000] + "..."
@@ -202,19 +224,24 @@ def upload_training_data(training_data, filename):
     if not training_data:
         raise Exception("No training data to upload")
     
-    # Convert to CSV
-    csv_buffer = io.StringIO()
-    fieldnames = training_data[0].keys()
-    writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames)
-    
-    writer.writeheader()
-    for entry in training_data:
-        writer.writerow(entry)
-    
-    # Upload to S3
-    s3_client.put_object(
-        Bucket=TRAINING_DATA_BUCKET,
-        Key=filename,
-        Body=csv_buffer.getvalue(),
-        ContentType='text/csv'
-    )
\ No newline at end of file
+    # Write CSV to a temp file on /tmp and stream it to S3, rather than
+    # holding the full CSV in memory as both a buffer and a string
+    with tempfile.TemporaryFile() as csv_file:
+        text_stream = io.TextIOWrapper(csv_file, encoding='utf-8', newline='')
+        fieldnames = training_data[0].keys()
+        writer = csv.DictWriter(text_stream, fieldnames=fieldnames)
+        
+        writer.writeheader()
+        writer.writerows(training_data)
+        
+        text_stream.flush()
+        text_stream.detach()
+        csv_file.seek(0)
+        
+        # Upload to S3
+        s3_client.upload_fileobj(
+            Fileobj=csv_file,
+            Bucket=TRAINING_DATA_BUCKET,
+            Key=filename,
+            ExtraArgs={'ContentType': 'text/csv'}
+        )
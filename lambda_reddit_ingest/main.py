@@ -1,33 +1,105 @@
 import os
 import json
+import gzip
+import orjson
 import boto3
+import praw
+from botocore.config import Config
 import time
-import hashlib
+import xxhash
+import re
+import logging
 from datetime import datetime
 from functools import wraps
 
-logger = __import__('logging').getLogger(__name__)
+logger = logging.getLogger(__name__)
 
-s3_client = boto3.client("s3")
-ssm_client = boto3.client("ssm")
-secrets_client = boto3.client("secretsmanager")
+boto_config = Config(
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+    connect_timeout=5,
+    read_timeout=60
+)
+
+s3_client = boto3.client("s3", config=boto_config)
+ssm_client = boto3.client("ssm", config=boto_config)
+secrets_client = boto3.client("secretsmanager", config=boto_config)
+dynamodb_client = boto3.client("dynamodb", config=boto_config)
 bedrock_runtime = None
-last_bedrock_call_time = 0
-BEDROCK_CALL_INTERVAL = 1.0  # Minimum seconds between Bedrock calls
 
 SSM_PARAMETER_NAME = "/reddit/last_post_timestamp"
 REDDIT_USER_AGENT = os.environ.get("REDDIT_USER_AGENT", "sentiment-analyzer")
 SUBREDDITS = os.environ.get("SUBREDDITS", "stocks,investing,wallstreetbets").split(',')
-IGNORE_KEYWORDS = os.environ.get("IGNORE_KEYWORDS", "").split(',')
+# Keyword lists are stripped and emptied of blanks once at load time
+KEYWORDS = [k.strip() for k in os.environ.get("KEYWORDS", "AAPL,TSLA,AMZN,GOOGL,MSFT").split(',') if k.strip()]
+IGNORE_KEYWORDS = [k.strip() for k in os.environ.get("IGNORE_KEYWORDS", "").split(',') if k.strip()]
 RAW_BUCKET_NAME = os.environ.get("RAW_BUCKET_NAME")
 POST_LIMIT = int(os.environ.get("POST_LIMIT", 100))
+# Reddit search time window (hour, day, week, ...); must cover the interval between runs
+SEARCH_TIME_FILTER = os.environ.get("SEARCH_TIME_FILTER", "day")
 MIN_POST_SCORE = int(os.environ.get("MIN_POST_SCORE", 10))
 MIN_POST_LENGTH = int(os.environ.get("MIN_POST_LENGTH", 200))
 MIN_COMMENT_SCORE = int(os.environ.get("MIN_COMMENT_SCORE", 5))
 MIN_COMMENT_LENGTH = int(os.environ.get("MIN_COMMENT_LENGTH", 50))
+COMMENT_FETCH_LIMIT = int(os.environ.get("COMMENT_FETCH_LIMIT", 500))
+COMMENT_FETCH_DEPTH = int(os.environ.get("COMMENT_FETCH_DEPTH", 10))
 BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
 BEDROCK_REGION = os.environ.get("BEDROCK_REGION", "us-east-1")
 ENABLE_AI_RELEVANCE_CHECK = os.environ.get("ENABLE_AI_RELEVANCE_CHECK", "true").lower() == "true"
+AI_BATCH_SIZE = int(os.environ.get("AI_BATCH_SIZE", 15))  # Posts classified per Bedrock call
+BEDROCK_CALLS_PER_MINUTE = int(os.environ.get("BEDROCK_CALLS_PER_MINUTE", 60))
+BEDROCK_BURST = int(os.environ.get("BEDROCK_BURST", 10))
+# Posts at or above this score are treated as relevant without a Bedrock call
+HIGH_CONFIDENCE_SCORE = int(os.environ.get("HIGH_CONF_SCORE", 500))
+SEEN_HASHES_TABLE = os.environ.get("SEEN_HASHES_TABLE")
+SEEN_HASH_TTL_DAYS = int(os.environ.get("SEEN_HASH_TTL_DAYS", 30))
+
+def compile_keyword_pattern(keywords):
+    """Compile keywords into one case-insensitive whole-word regex, or None if there are none."""
+    if not keywords:
+        return None
+    return re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")\b", re.IGNORECASE)
+
+KEYWORD_PATTERN = compile_keyword_pattern(KEYWORDS)
+IGNORE_KEYWORD_PATTERN = compile_keyword_pattern(IGNORE_KEYWORDS)
+SEARCH_QUERY = " OR ".join(KEYWORDS)
+# Cashtags and filing/earnings mentions are unambiguous enough to skip Bedrock
+STRONG_PATTERNS = re.compile(r"\$[A-Z]{1,5}\b|\b(?i:earnings|10-K)\b")
+# Matches one {"i": N, "d": "RELEVANT"|"IRRELEVANT"} entry in the batched Bedrock response
+DECISION_PATTERN = re.compile(r'"i"\s*:\s*(\d+)\s*,\s*"d"\s*:\s*"(RELEVANT|IRRELEVANT)"', re.IGNORECASE)
+
+# Static instructions shared by every relevance call; only the numbered posts vary per request
+STATIC_CRITERIA = """You are a financial analyst specializing in equity research and investment analysis.
+
+Analyze each numbered Reddit post to determine if it contains ANY financial or stock-related discussion.
+
+Criteria for RELEVANT (be PERMISSIVE):
+- ANY mention of stocks, companies, or investing
+- Financial news or earnings discussion
+- Market analysis or opinions
+- Company updates or product discussions
+- Investment ideas or stock picks
+- Trading discussions
+- Economic news or analysis
+
+Criteria for IRRELEVANT (be RESTRICTIVE):
+- Pure memes with no financial content
+- Off-topic personal posts
+- Non-financial technical discussions
+
+Be generous with RELEVANT decisions. When in doubt, choose RELEVANT.
+
+Respond with only a JSON object with one entry per post: {"decisions": [{"i": 1, "d": "RELEVANT"}, {"i": 2, "d": "IRRELEVANT"}]}"""
+
+# Prompt caching is only accepted by newer Claude models on Bedrock, so it is opt-in
+BEDROCK_PROMPT_CACHING = os.environ.get("BEDROCK_PROMPT_CACHING", "false").lower() == "true"
+SYSTEM_PROMPT = [{"type": "text", "text": STATIC_CRITERIA}]
+if BEDROCK_PROMPT_CACHING:
+    SYSTEM_PROMPT[0]["cache_control"] = {"type": "ephemeral"}
+
+# {"i": 15, "d": "IRRELEVANT"}, is about a dozen tokens
+DECISION_TOKENS_PER_POST = 12
 
 reddit = None
 
@@ -50,15 +122,35 @@ def retry_with_backoff(max_retries=3, base_delay=1.0, max_delay=60.0):
         return wrapper
     return decorator
 
-def generate_content_hash(content):
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
+class TokenBucket:
+    """Token-bucket rate limiter: refills at a steady rate and allows bursts up to capacity."""
 
-def safe_reddit_operation(operation, *args, **kwargs):
-    try:
-        return operation(*args, **kwargs)
-    except Exception as e:
-        logger.error(f"Reddit operation failed: {e}")
-        raise
+    def __init__(self, rate_per_minute, burst):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+
+    def acquire(self, tokens=1):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate_per_second)
+            self.last_refill = now
+            
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            
+            time.sleep((tokens - self.tokens) / self.rate_per_second)
+
+bedrock_limiter = TokenBucket(BEDROCK_CALLS_PER_MINUTE, BEDROCK_BURST)
+
+def generate_content_hash(*parts):
+    # Parts are fed incrementally, equivalent to hashing their concatenation
+    content_hash = xxhash.xxh3_64()
+    for part in parts:
+        content_hash.update(part.encode('utf-8'))
+    return content_hash.hexdigest()
 
 def validate_post_data(post_data):
     required_fields = ['type', 'id', 'subreddit', 'created_utc', 'score']
@@ -88,7 +180,8 @@ def initialize_bedrock_client():
         try:
             bedrock_runtime = boto3.client(
                 service_name='bedrock-runtime',
-                region_name=BEDROCK_REGION
+                region_name=BEDROCK_REGION,
+                config=boto_config
             )
             return bedrock_runtime
         except Exception as e:
@@ -114,56 +207,74 @@ def set_last_timestamp(timestamp):
         Overwrite=True
     )
 
-@retry_with_backoff(max_retries=3, base_delay=2.0, max_delay=30.0)
-def is_post_relevant_by_ai(post, bedrock_client):
-    global last_bedrock_call_time
+def get_seen_hashes(content_hashes):
+    """Return the subset of content hashes already recorded by a previous run."""
+    seen = set()
+    if not SEEN_HASHES_TABLE or not content_hashes:
+        return seen
     
-    if not post or not bedrock_client:
-        return False
+    unique_hashes = list(set(content_hashes))
+    # BatchGetItem accepts at most 100 keys per request
+    for start in range(0, len(unique_hashes), 100):
+        request_items = {
+            SEEN_HASHES_TABLE: {
+                'Keys': [{'content_hash': {'S': h}} for h in unique_hashes[start:start + 100]],
+                'ProjectionExpression': 'content_hash'
+            }
+        }
+        while request_items:
+            response = dynamodb_client.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(SEEN_HASHES_TABLE, []):
+                seen.add(item['content_hash']['S'])
+            request_items = response.get('UnprocessedKeys')
+            if request_items:
+                time.sleep(0.1)
     
-    if len(post.title + post.selftext) < 50:
-        return False
+    return seen
+
+def record_seen_hashes(content_hashes):
+    """Record content hashes with a TTL so later runs can skip them."""
+    if not SEEN_HASHES_TABLE or not content_hashes:
+        return
     
-    # Rate limiting: ensure minimum interval between calls
-    current_time = time.time()
-    time_since_last_call = current_time - last_bedrock_call_time
-    if time_since_last_call < BEDROCK_CALL_INTERVAL:
-        sleep_time = BEDROCK_CALL_INTERVAL - time_since_last_call
-        time.sleep(sleep_time)
+    expires_at = str(int(time.time()) + SEEN_HASH_TTL_DAYS * 86400)
+    unique_hashes = list(set(content_hashes))
+    # BatchWriteItem accepts at most 25 items per request
+    for start in range(0, len(unique_hashes), 25):
+        request_items = {
+            SEEN_HASHES_TABLE: [
+                {'PutRequest': {'Item': {'content_hash': {'S': h}, 'expires_at': {'N': expires_at}}}}
+                for h in unique_hashes[start:start + 25]
+            ]
+        }
+        while request_items:
+            response = dynamodb_client.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if request_items:
+                time.sleep(0.1)
+
+@retry_with_backoff(max_retries=3, base_delay=2.0, max_delay=30.0)
+def classify_posts_relevance_by_ai(posts, bedrock_client):
+    """Classify a batch of posts in a single Bedrock call; returns one bool per post."""
+    if not posts or not bedrock_client:
+        return [False] * len(posts)
     
-    last_bedrock_call_time = time.time()
+    # Rate limiting: bursts are allowed up to the bucket capacity
+    bedrock_limiter.acquire()
     
-    system_prompt = "You are a financial analyst specializing in equity research and investment analysis."
+    numbered_posts = "\n\n".join(
+        f"[{i}] Title: {post.title[:200]}\nContent: {post.selftext[:400]}"
+        for i, post in enumerate(posts, 1)
+    )
     
-    user_prompt = f"""Analyze the following Reddit post to determine if it contains ANY financial or stock-related discussion.
-
-Post Title: {post.title[:200]}
-Post Content: {post.selftext[:800]}
-
-Criteria for RELEVANT (be PERMISSIVE):
-- ANY mention of stocks, companies, or investing
-- Financial news or earnings discussion
-- Market analysis or opinions
-- Company updates or product discussions
-- Investment ideas or stock picks
-- Trading discussions
-- Economic news or analysis
-
-Criteria for IRRELEVANT (be RESTRICTIVE):
-- Pure memes with no financial content
-- Off-topic personal posts
-- Non-financial technical discussions
-
-Be generous with RELEVANT decisions. When in doubt, choose RELEVANT.
-
-Respond with only a JSON object: {{"decision": "RELEVANT"}} or {{"decision": "IRRELEVANT"}}"""
+    user_prompt = f"Classify these posts:\n\n{numbered_posts}"
 
     try:
         request_body = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 50,
+            "max_tokens": DECISION_TOKENS_PER_POST * len(posts) + 10,
             "temperature": 0,
-            "system": system_prompt,
+            "system": SYSTEM_PROMPT,
             "messages": [
                 {
                     "role": "user",
@@ -183,37 +294,162 @@ Respond with only a JSON object: {{"decision": "RELEVANT"}} or {{"decision": "IR
         if 'content' in response_body and len(response_body['content']) > 0:
             content = response_body['content'][0]['text']
             
-            try:
-                decision_json = json.loads(content.strip())
-                decision = decision_json.get('decision', '').upper()
-                is_relevant = decision == 'RELEVANT'
-                return is_relevant
-            except json.JSONDecodeError:
-                is_relevant = 'RELEVANT' in content.upper()
-                return is_relevant
+            # Regex extraction tolerates prose around the JSON without a decode/raise cycle
+            decisions = {
+                int(match.group(1)): match.group(2).upper()
+                for match in DECISION_PATTERN.finditer(content)
+            }
+            if not decisions:
+                logger.warning("Could not parse Bedrock batch response, treating batch as relevant")
+                return [True] * len(posts)
+            
+            # Posts the model skipped are treated as relevant, matching the permissive policy
+            return [decisions.get(i, 'RELEVANT') == 'RELEVANT' for i in range(1, len(posts) + 1)]
         else:
-            return False
+            return [False] * len(posts)
             
     except Exception as e:
         error_msg = str(e)
         if "You don't have access to the model" in error_msg:
             logger.error("Bedrock model access denied")
-            return False
+            return [False] * len(posts)
         elif "ThrottlingException" in error_msg or "Too many requests" in error_msg:
             logger.warning(f"Bedrock throttling detected: {e}")
             # Return True to be permissive when throttled rather than rejecting all posts
-            return True
+            return [True] * len(posts)
         elif "ValidationException" in error_msg:
             logger.error(f"Bedrock validation error: {e}")
-            return False
+            return [False] * len(posts)
         else:
             logger.error(f"Unexpected error in Bedrock relevance check: {e}")
             # Return True to be permissive on unknown errors
-            return True
+            return [True] * len(posts)
 
-def lambda_handler(event, context):
-    global reddit
+def batch_ai_relevance(posts, bedrock_client, batch_size=AI_BATCH_SIZE):
+    """Classify posts through Bedrock in batches; returns one bool per post."""
+    decisions = {}
+    
+    # Posts too short to judge are rejected without spending tokens on them;
+    # high-score and strong-signal posts are accepted without them
+    eligible = []
+    for post in posts:
+        if len(post.title) + len(post.selftext) < 50:
+            continue
+        if post.score >= HIGH_CONFIDENCE_SCORE or STRONG_PATTERNS.search(post.title) or STRONG_PATTERNS.search(post.selftext):
+            decisions[post.id] = True
+        else:
+            eligible.append(post)
     
+    for start in range(0, len(eligible), batch_size):
+        batch = eligible[start:start + batch_size]
+        for post, relevant in zip(batch, classify_posts_relevance_by_ai(batch, bedrock_client)):
+            decisions[post.id] = relevant
+    
+    return [decisions.get(post.id, False) for post in posts]
+
+def fetch_comment_data(post_id):
+    """Fetch a post's comment tree in one request and flatten it to raw comment dicts.
+
+    "more" stubs are skipped rather than expanded, matching replace_more(limit=0).
+    """
+    response = reddit.request(
+        method="GET",
+        path=f"/comments/{post_id}",
+        params={"limit": COMMENT_FETCH_LIMIT, "depth": COMMENT_FETCH_DEPTH, "sort": "top", "raw_json": 1}
+    )
+    
+    comments = []
+    stack = list(reversed(response[1]["data"]["children"]))
+    while stack:
+        child = stack.pop()
+        if child.get("kind") != "t1":
+            continue
+        
+        data = child["data"]
+        comments.append(data)
+        
+        replies = data.get("replies")
+        if replies:
+            stack.extend(reversed(replies["data"]["children"]))
+    
+    return comments
+
+def collect_post_records(post, sub_name, content_hash=None):
+    """Build the post record plus its qualifying comment records."""
+    records = []
+    
+    post_data = {
+        "type": "post",
+        "id": post.id,
+        "title": post.title,
+        "selftext": post.selftext,
+        "url": post.url,
+        "subreddit": sub_name,
+        "created_utc": post.created_utc,
+        "score": post.score,
+        "num_comments": post.num_comments,
+        "content_hash": content_hash or generate_content_hash(post.title, post.selftext)
+    }
+    
+    if not validate_post_data(post_data):
+        return records
+    
+    records.append(sanitize_post_data(post_data))
+    
+    logger.info(f"Added post {post.id}: '{post.title[:50]}...' (score: {post.score})")
+    
+    try:
+        for comment in fetch_comment_data(post.id):
+            try:
+                if comment["score"] < MIN_COMMENT_SCORE:
+                    continue
+                if len(comment["body"]) < MIN_COMMENT_LENGTH:
+                    continue
+                
+                comment_data = {
+                    "type": "comment",
+                    "id": comment["id"],
+                    "post_id": post.id,
+                    "body": comment["body"],
+                    "url": comment["permalink"],
+                    "subreddit": sub_name,
+                    "created_utc": comment["created_utc"],
+                    "score": comment["score"],
+                    "content_hash": generate_content_hash(comment["body"])
+                }
+                
+                if not validate_post_data(comment_data):
+                    continue
+                
+                records.append(sanitize_post_data(comment_data))
+                
+            except Exception as comment_error:
+                continue
+    
+    except Exception as comments_error:
+        logger.error(f"Reddit operation failed: {comments_error}")
+    
+    return records
+
+def get_reddit_client():
+    global reddit
+    if reddit is None:
+        client_id, client_secret = get_reddit_credentials()
+        reddit = praw.Reddit(
+            client_id=client_id, client_secret=client_secret, user_agent=REDDIT_USER_AGENT
+        )
+    return reddit
+
+# Create the Reddit and Bedrock clients during container init so the Secrets
+# Manager lookup and client setup are paid once per container, not per invocation
+if os.environ.get("REDDIT_SECRET_NAME"):
+    try:
+        get_reddit_client()
+    except Exception as e:
+        logger.error(f"Failed to initialize Reddit client during init: {e}")
+initialize_bedrock_client()
+
+def lambda_handler(event, context):
     logger.info("Starting Reddit ingestion process...")
     
     # Debug logging setup
@@ -222,12 +458,7 @@ def lambda_handler(event, context):
     logger.setLevel(logging.INFO)
     
     try:
-        if not reddit:
-            client_id, client_secret = get_reddit_credentials()
-            import praw
-            reddit = praw.Reddit(
-                client_id=client_id, client_secret=client_secret, user_agent=REDDIT_USER_AGENT
-            )
+        reddit = get_reddit_client()
 
         bedrock_client = initialize_bedrock_client()
         if bedrock_client:
@@ -235,8 +466,6 @@ def lambda_handler(event, context):
         else:
             logger.warning("Bedrock client initialization failed - AI relevance checking will be disabled")
 
-        KEYWORDS = os.environ.get("KEYWORDS", "AAPL,TSLA,AMZN,GOOGL,MSFT").split(',')
-
         last_timestamp = get_last_timestamp()
         processed_data = []
         newest_timestamp = 0
@@ -255,157 +484,127 @@ def lambda_handler(event, context):
         
         # Quick fix: You can set ENABLE_AI_RELEVANCE_CHECK=false in Lambda environment to bypass AI filtering
 
-        for sub_name in SUBREDDITS:
-            logger.info(f"Processing subreddit: {sub_name}")
-            try:
-                subreddit = reddit.subreddit(sub_name)
-                posts = safe_reddit_operation(subreddit.new, limit=POST_LIMIT)
-                
-                posts_examined = 0
-                posts_after_timestamp = 0
-                posts_with_keywords = 0
-                posts_meeting_score = 0
-                posts_meeting_length = 0
-                posts_ai_relevant = 0
-                
-                for post in posts:
-                    try:
-                        posts_examined += 1
-                        
-                        if last_timestamp and post.created_utc < last_timestamp:
-                            logger.debug(f"Skipping old post {post.id} (created: {datetime.fromtimestamp(post.created_utc)})")
-                            continue
-                        
-                        posts_after_timestamp += 1
-                        newest_timestamp = max(newest_timestamp, post.created_utc)
-                        
-                        logger.debug(f"Examining post {post.id}: '{post.title[:50]}...' (score: {post.score}, length: {len(post.selftext)})")
-                        
-                        post_text = (post.title + " " + post.selftext).lower()
-                        
-                        # Keyword check
-                        has_keywords = any(keyword.lower() in post_text for keyword in KEYWORDS)
-                        if not has_keywords:
-                            logger.debug(f"Post {post.id} rejected: no matching keywords")
-                            continue
-                        posts_with_keywords += 1
-                        
-                        # Ignore keywords check
-                        has_ignore_keywords = any(ikw.lower() in post_text for ikw in IGNORE_KEYWORDS if ikw)
-                        if has_ignore_keywords:
-                            logger.debug(f"Post {post.id} rejected: contains ignore keywords")
-                            continue
-                        
-                        # Score check
-                        if post.score < MIN_POST_SCORE:
-                            logger.debug(f"Post {post.id} rejected: score {post.score} < {MIN_POST_SCORE}")
-                            continue
-                        posts_meeting_score += 1
-                        
-                        # Length check
-                        if len(post.selftext) < MIN_POST_LENGTH:
-                            logger.debug(f"Post {post.id} rejected: length {len(post.selftext)} < {MIN_POST_LENGTH}")
-                            continue
-                        posts_meeting_length += 1
-                        
-                        if ENABLE_AI_RELEVANCE_CHECK and bedrock_client:
-                            ai_relevant = is_post_relevant_by_ai(post, bedrock_client)
-                            if not ai_relevant:
-                                logger.debug(f"Post {post.id} rejected: AI relevance check failed")
-                                continue
-                            posts_ai_relevant += 1
-                            logger.debug(f"Post {post.id} passed AI relevance check")
-                        elif ENABLE_AI_RELEVANCE_CHECK and not bedrock_client:
-                            logger.warning("AI relevance check is enabled but Bedrock client is not available")
-                        else:
-                            posts_ai_relevant += 1
-
-                        post_data = {
-                            "type": "post",
-                            "id": post.id,
-                            "title": post.title,
-                            "selftext": post.selftext,
-                            "url": post.url,
-                            "subreddit": sub_name,
-                            "created_utc": post.created_utc,
-                            "score": post.score,
-                            "num_comments": post.num_comments,
-                            "content_hash": generate_content_hash(post.title + post.selftext)
-                        }
-                        
-                        if not validate_post_data(post_data):
-                            continue
-                        
-                        post_data = sanitize_post_data(post_data)
-                        processed_data.append(post_data)
-                        
-                        logger.info(f"Added post {post.id}: '{post.title[:50]}...' (score: {post.score})")
-                        
-                        try:
-                            safe_reddit_operation(post.comments.replace_more, limit=0)
-                            comments = safe_reddit_operation(post.comments.list)
-                            
-                            for comment in comments:
-                                try:
-                                    if comment.score < MIN_COMMENT_SCORE:
-                                        continue
-                                    if len(comment.body) < MIN_COMMENT_LENGTH:
-                                        continue
-                                    
-                                    comment_data = {
-                                        "type": "comment",
-                                        "id": comment.id,
-                                        "post_id": post.id,
-                                        "body": comment.body,
-                                        "url": comment.permalink,
-                                        "subreddit": sub_name,
-                                        "created_utc": comment.created_utc,
-                                        "score": comment.score,
-                                        "content_hash": generate_content_hash(comment.body)
-                                    }
-                                    
-                                    if not validate_post_data(comment_data):
-                                        continue
-                                    
-                                    comment_data = sanitize_post_data(comment_data)
-                                    processed_data.append(comment_data)
-                                    
-                                except Exception as comment_error:
-                                    continue
+        try:
+            # One server-side search across all subreddits: Reddit applies the keyword
+            # filter, so posts without keywords never reach the loop below
+            combined_subreddits = reddit.subreddit("+".join(SUBREDDITS))
+            if SEARCH_QUERY:
+                posts = combined_subreddits.search(SEARCH_QUERY, sort="new", time_filter=SEARCH_TIME_FILTER, limit=POST_LIMIT)
+            else:
+                posts = combined_subreddits.new(limit=POST_LIMIT)
+            
+            posts_examined = 0
+            posts_after_timestamp = 0
+            posts_with_keywords = 0
+            posts_meeting_score = 0
+            posts_meeting_length = 0
+            posts_already_seen = 0
+            posts_ai_relevant = 0
+            candidates = []
+            
+            for post in posts:
+                try:
+                    posts_examined += 1
+                    
+                    if last_timestamp and post.created_utc < last_timestamp:
+                        logger.debug("Skipping old post %s (created: %s)", post.id, post.created_utc)
+                        continue
+                    
+                    posts_after_timestamp += 1
+                    newest_timestamp = max(newest_timestamp, post.created_utc)
+                    
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Examining post %s: '%s...' (score: %s, length: %s)", post.id, post.title[:50], post.score, len(post.selftext))
+                    
+                    # Score check (cheap numeric checks run before the keyword scans)
+                    if post.score < MIN_POST_SCORE:
+                        logger.debug("Post %s rejected: score %s < %s", post.id, post.score, MIN_POST_SCORE)
+                        continue
+                    posts_meeting_score += 1
+                    
+                    # Length check
+                    if len(post.selftext) < MIN_POST_LENGTH:
+                        logger.debug("Post %s rejected: length %s < %s", post.id, len(post.selftext), MIN_POST_LENGTH)
+                        continue
+                    posts_meeting_length += 1
+                    
+                    # Keyword check: search matching is loose (stemmed), so confirm a whole-word match
+                    has_keywords = KEYWORD_PATTERN is not None and (
+                        KEYWORD_PATTERN.search(post.title) or KEYWORD_PATTERN.search(post.selftext)
+                    )
+                    if not has_keywords:
+                        logger.debug("Post %s rejected: no matching keywords", post.id)
+                        continue
+                    posts_with_keywords += 1
+                    
+                    # Ignore keywords check
+                    has_ignore_keywords = IGNORE_KEYWORD_PATTERN is not None and (
+                        IGNORE_KEYWORD_PATTERN.search(post.title) or IGNORE_KEYWORD_PATTERN.search(post.selftext)
+                    )
+                    if has_ignore_keywords:
+                        logger.debug("Post %s rejected: contains ignore keywords", post.id)
+                        continue
+                    
+                    candidates.append(post)
                         
-                        except Exception as comments_error:
-                            pass
+                except Exception as post_error:
+                    continue
+            
+            # Skip posts whose content was already processed by a previous run
+            candidate_hashes = {post.id: generate_content_hash(post.title, post.selftext) for post in candidates}
+            try:
+                seen_hashes = get_seen_hashes(list(candidate_hashes.values()))
+            except Exception as seen_error:
+                logger.warning(f"Seen-hash lookup failed, processing all candidates: {seen_error}")
+                seen_hashes = set()
+            if seen_hashes:
+                candidates = [post for post in candidates if candidate_hashes[post.id] not in seen_hashes]
+            posts_already_seen = len(candidate_hashes) - len(candidates)
+            
+            # Classify all candidates in batched Bedrock calls instead of one call per post
+            if ENABLE_AI_RELEVANCE_CHECK and bedrock_client:
+                decisions = batch_ai_relevance(candidates, bedrock_client)
+                relevant_posts = [post for post, relevant in zip(candidates, decisions) if relevant]
+                posts_ai_relevant = len(relevant_posts)
+                logger.debug("%s of %s posts passed AI relevance check", posts_ai_relevant, len(candidates))
+            elif ENABLE_AI_RELEVANCE_CHECK and not bedrock_client:
+                logger.warning("AI relevance check is enabled but Bedrock client is not available")
+                relevant_posts = candidates
+            else:
+                relevant_posts = candidates
+                posts_ai_relevant = len(candidates)
+            
+            for post in relevant_posts:
+                try:
+                    processed_data.extend(collect_post_records(post, post.subreddit.display_name, candidate_hashes[post.id]))
+                    
+                    if len(processed_data) >= POST_LIMIT:
+                        break
                         
-                        if len(processed_data) >= POST_LIMIT:
-                            break
-                            
-                    except Exception as post_error:
-                        continue
-                
-                # Log subreddit statistics
-                logger.info(f"Subreddit {sub_name} stats:")
-                logger.info(f"  - Posts examined: {posts_examined}")
-                logger.info(f"  - Posts after timestamp: {posts_after_timestamp}")
-                logger.info(f"  - Posts with keywords: {posts_with_keywords}")
-                logger.info(f"  - Posts meeting score: {posts_meeting_score}")
-                logger.info(f"  - Posts meeting length: {posts_meeting_length}")
-                logger.info(f"  - Posts AI relevant: {posts_ai_relevant}")
-                
-                if len(processed_data) >= POST_LIMIT:
-                    break
-
-            except Exception as sub_error:
-                logger.error(f"Error processing subreddit {sub_name}: {sub_error}")
-                continue
+                except Exception as post_error:
+                    continue
+            
+            # Log search statistics
+            logger.info("Search stats:")
+            logger.info(f"  - Posts examined: {posts_examined}")
+            logger.info(f"  - Posts after timestamp: {posts_after_timestamp}")
+            logger.info(f"  - Posts meeting score: {posts_meeting_score}")
+            logger.info(f"  - Posts meeting length: {posts_meeting_length}")
+            logger.info(f"  - Posts with keywords: {posts_with_keywords}")
+            logger.info(f"  - Posts already seen: {posts_already_seen}")
+            logger.info(f"  - Posts AI relevant: {posts_ai_relevant}")
+            
+        except Exception as search_error:
+            logger.error(f"Error searching subreddits {SUBREDDITS}: {search_error}")
         
         if not processed_data:
-            logger.warning("No new data collected after processing all subreddits")
+            logger.warning("No new data collected from subreddit search")
             return {"statusCode": 200, "body": "No new data."}
         
         logger.info(f"Total items collected: {len(processed_data)}")
 
         timestamp = datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S")
-        filename = f"{timestamp}.json"
+        filename = f"{timestamp}.json.gz"
         s3_key = f"reddit-posts/{filename}"
 
         try:
@@ -422,10 +621,16 @@ def lambda_handler(event, context):
             s3_client.put_object(
                 Bucket=RAW_BUCKET_NAME, 
                 Key=s3_key,
-                Body=json.dumps(data_with_metadata, indent=2),
-                ContentType="application/json"
+                Body=gzip.compress(orjson.dumps(data_with_metadata), compresslevel=1),
+                ContentType="application/json",
+                ContentEncoding="gzip"
             )
             
+            try:
+                record_seen_hashes([item["content_hash"] for item in processed_data if item["type"] == "post"])
+            except Exception as seen_error:
+                logger.warning(f"Failed to record seen hashes: {seen_error}")
+            
             if newest_timestamp > 0:
                 new_dt = datetime.fromtimestamp(newest_timestamp)
                 logger.info(f"Updating timestamp to: {newest_timestamp} ({new_dt})")
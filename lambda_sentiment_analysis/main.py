@@ -1,31 +1,98 @@
 import os
 import json
+import gzip
+import ijson
+import itertools
+import pyarrow as pa
+import pyarrow.parquet as pq
 import boto3
+from botocore.config import Config
 import urllib.parse
 import logging
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-s3_client = boto3.client("s3")
-comprehend_client = boto3.client("comprehend")
+boto_config = Config(
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    connect_timeout=5,
+    read_timeout=60
+)
+
+s3_client = boto3.client("s3", config=boto_config)
+comprehend_client = boto3.client("comprehend", config=boto_config)
 # Configure SageMaker client with longer timeouts for serverless endpoints
 sagemaker_runtime = boto3.client(
     "sagemaker-runtime", 
-    config=boto3.session.Config(
+    config=boto_config.merge(Config(
         read_timeout=120,  # 2 minutes for serverless cold start
         connect_timeout=60,  # 1 minute connection timeout
-        retries={'max_attempts': 2}  # Retry once if timeout
-    )
+        retries={'max_attempts': 2, 'mode': 'adaptive'}  # Retry once if timeout
+    ))
 )
 
 PROCESSED_BUCKET_NAME = os.environ.get("PROCESSED_BUCKET_NAME")
 COMPREHEND_LANGUAGE = os.environ.get("COMPREHEND_LANGUAGE", "en")
 SAGEMAKER_ENDPOINT_NAME = os.environ.get("SAGEMAKER_ENDPOINT_NAME", "informative-emotional-endpoint")
 ENABLE_SAGEMAKER_CLASSIFICATION = os.environ.get("ENABLE_SAGEMAKER_CLASSIFICATION", "true").lower() == "true"
+SAGEMAKER_MAX_WORKERS = int(os.environ.get("SAGEMAKER_MAX_WORKERS", "16"))
+
+# BatchDetectSentiment accepts at most 25 documents of up to 5000 UTF-8 bytes each
+COMPREHEND_BATCH_SIZE = 25
+COMPREHEND_MAX_TEXT_BYTES = 5000
+UNKNOWN_SENTIMENT = {
+    "Sentiment": "UNKNOWN",
+    "SentimentScore": {"Positive": 0.0, "Negative": 0.0, "Neutral": 0.0, "Mixed": 0.0}
+}
+# Texts shorter than this are recorded as neutral without calling Comprehend
+MIN_SENTIMENT_TEXT_LENGTH = 10
+SHORT_TEXT_SENTIMENT = {
+    "Sentiment": "NEUTRAL",
+    "SentimentScore": {"Positive": 0.0, "Negative": 0.0, "Neutral": 1.0, "Mixed": 0.0}
+}
+
+# Columnar layout of processed items. Nested structs keep the field paths the
+# Athena queries use (e.g. content_type.probabilities.informative) while each
+# leaf is stored as its own Parquet column. Names are lowercase for Athena.
+SCORE_TYPE = pa.float32()
+PROCESSED_SCHEMA = pa.schema([
+    ("type", pa.string()),
+    ("id", pa.string()),
+    ("post_id", pa.string()),
+    ("title", pa.string()),
+    ("selftext", pa.string()),
+    ("body", pa.string()),
+    ("url", pa.string()),
+    ("subreddit", pa.string()),
+    ("created_utc", pa.float64()),
+    ("score", pa.int64()),
+    ("num_comments", pa.int64()),
+    ("content_hash", pa.string()),
+    ("sentiment", pa.struct([
+        ("sentiment", pa.string()),
+        ("sentimentscore", pa.struct([
+            ("positive", SCORE_TYPE),
+            ("negative", SCORE_TYPE),
+            ("neutral", SCORE_TYPE),
+            ("mixed", SCORE_TYPE)
+        ]))
+    ])),
+    ("content_type", pa.struct([
+        ("classification", pa.string()),
+        ("confidence", SCORE_TYPE),
+        ("probabilities", pa.struct([
+            ("informative", SCORE_TYPE),
+            ("emotional", SCORE_TYPE)
+        ])),
+        ("error", pa.string())
+    ]))
+])
 
 def lambda_handler(event, context):
     try:
@@ -58,14 +125,15 @@ def lambda_handler(event, context):
 
     try:
         response = s3_client.get_object(Bucket=bucket, Key=key)
-        json_data = json.loads(response["Body"].read().decode("utf-8"))
-        
-        if isinstance(json_data, dict) and "data" in json_data:
-            posts = json_data["data"]
-        else:
-            posts = json_data
+        body = response["Body"]
+        if response.get("ContentEncoding") == "gzip" or key.endswith(".gz"):
+            body = gzip.GzipFile(fileobj=body)
+        # Posts are parsed incrementally from the stream rather than loading the whole file
+        posts = iter_posts(body)
 
-        processed_items = []
+        # Collect analyzable items first so Comprehend can be called in batches
+        items_to_analyze = []
+        texts_to_analyze = []
         for item in posts:
             text_to_analyze = ""
             if item.get("type") == "post":
@@ -76,53 +144,36 @@ def lambda_handler(event, context):
             if not text_to_analyze:
                 continue
 
-            # AWS Comprehend sentiment analysis (existing functionality)
-            sentiment_response = comprehend_client.detect_sentiment(
-                Text=text_to_analyze,
-                LanguageCode=COMPREHEND_LANGUAGE
-            )
+            items_to_analyze.append(item)
+            texts_to_analyze.append(text_to_analyze)
 
-            item["sentiment"] = {
-                "Sentiment": sentiment_response["Sentiment"],
-                "SentimentScore": sentiment_response["SentimentScore"]
-            }
+        # AWS Comprehend sentiment analysis (existing functionality)
+        sentiments = detect_sentiment_batch(texts_to_analyze)
 
-            # SageMaker informative/emotional classification (new functionality)
-            if ENABLE_SAGEMAKER_CLASSIFICATION:
-                try:
-                    content_type_result = classify_content_type(text_to_analyze)
-                    item["content_type"] = content_type_result
-                    logger.info(f"Content type classification: {content_type_result['Classification']} (confidence: {content_type_result['Confidence']:.3f})")
-                except Exception as e:
-                    logger.error(f"SageMaker classification failed: {str(e)}")
-                    # Add fallback classification
-                    item["content_type"] = {
-                        "Classification": "UNKNOWN",
-                        "Confidence": 0.0,
-                        "Error": str(e)
-                    }
-            else:
-                # SageMaker classification disabled
-                item["content_type"] = {
-                    "Classification": "DISABLED",
-                    "Confidence": 0.0
-                }
+        # SageMaker informative/emotional classification (new functionality)
+        if ENABLE_SAGEMAKER_CLASSIFICATION:
+            content_types = classify_content_types_parallel(texts_to_analyze)
+        else:
+            # SageMaker classification disabled
+            content_types = [{"Classification": "DISABLED", "Confidence": 0.0} for _ in texts_to_analyze]
 
+        processed_items = []
+        for item, sentiment, content_type in zip(items_to_analyze, sentiments, content_types):
+            item["sentiment"] = sentiment
+            item["content_type"] = content_type
             processed_items.append(item)
 
         if not processed_items:
             print("No items to process.")
             return {"statusCode": 200, "body": "No items processed."}
 
-        output_key = key  # Keep same path structure: reddit-posts/
-        # Convert to newline-delimited JSON for Athena compatibility
-        ndjson_content = '\n'.join(json.dumps(item) for item in processed_items)
-        
+        # Keep same path structure: reddit-posts/, swapping the raw file extension for .parquet
+        output_key = parquet_key(key)
         s3_client.put_object(
             Bucket=PROCESSED_BUCKET_NAME,
             Key=output_key,
-            Body=ndjson_content,
-            ContentType="application/json"
+            Body=to_parquet_bytes(processed_items),
+            ContentType="application/vnd.apache.parquet"
         )
 
         print(f"Successfully processed {len(processed_items)} items to s3://{PROCESSED_BUCKET_NAME}/{output_key}")
@@ -132,6 +183,133 @@ def lambda_handler(event, context):
         logger.error(f"Error processing file: {e}")
         return {"statusCode": 500, "body": f"Error: {e}"}
 
+def iter_posts(stream):
+    """
+    Incrementally parse posts from a JSON stream.
+    
+    Args:
+        stream: File-like object containing either {"metadata": ..., "data": [...]} or a bare list
+    
+    Returns:
+        iterator: Post dicts, parsed one at a time
+    """
+    events = ijson.parse(stream, use_float=True)
+    first_event = next(events, None)
+    if first_event is None:
+        return iter(())
+    
+    prefix = "item" if first_event[1] == "start_array" else "data.item"
+    return ijson.items(itertools.chain([first_event], events), prefix)
+
+def parquet_key(key):
+    """Map a raw object key (.json or .json.gz) to its processed .parquet key."""
+    for suffix in (".json.gz", ".json", ".gz"):
+        if key.endswith(suffix):
+            return key[:-len(suffix)] + ".parquet"
+    return f"{key}.parquet"
+
+def lowercase_keys(value):
+    """Recursively lowercase dict keys so nested results match PROCESSED_SCHEMA."""
+    if isinstance(value, dict):
+        return {k.lower(): lowercase_keys(v) for k, v in value.items()}
+    return value
+
+def to_parquet_bytes(items):
+    """
+    Serialize processed items to a zstd-compressed Parquet file.
+    
+    Args:
+        items (list): Processed post and comment dicts
+    
+    Returns:
+        bytes: Parquet file contents
+    """
+    table = pa.Table.from_pylist([lowercase_keys(item) for item in items], schema=PROCESSED_SCHEMA)
+    buffer = pa.BufferOutputStream()
+    pq.write_table(table, buffer, compression="zstd", use_dictionary=True)
+    return buffer.getvalue().to_pybytes()
+
+def truncate_utf8(text, max_bytes):
+    """Truncate text so its UTF-8 encoding fits in max_bytes without splitting a character."""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode('utf-8', errors='ignore')
+
+def detect_sentiment_batch(texts):
+    """
+    Run Comprehend sentiment analysis over texts using BatchDetectSentiment.
+    
+    Identical texts are sent once and texts too short to carry signal are not
+    sent at all, so each distinct, meaningful text is billed a single time.
+    
+    Args:
+        texts (list): Texts to analyze
+    
+    Returns:
+        list: One sentiment dict per input text, in input order
+    """
+    unique_sentiments = {}
+    for text in texts:
+        if len(text.strip()) < MIN_SENTIMENT_TEXT_LENGTH:
+            unique_sentiments[text] = SHORT_TEXT_SENTIMENT
+        else:
+            unique_sentiments.setdefault(text, None)
+    
+    pending_texts = [text for text, sentiment in unique_sentiments.items() if sentiment is None]
+    logger.info(f"Sending {len(pending_texts)} unique texts to Comprehend for {len(texts)} items")
+    
+    for start in range(0, len(pending_texts), COMPREHEND_BATCH_SIZE):
+        batch_texts = pending_texts[start:start + COMPREHEND_BATCH_SIZE]
+        response = comprehend_client.batch_detect_sentiment(
+            TextList=[truncate_utf8(text, COMPREHEND_MAX_TEXT_BYTES) for text in batch_texts],
+            LanguageCode=COMPREHEND_LANGUAGE
+        )
+        
+        for result in response["ResultList"]:
+            unique_sentiments[batch_texts[result["Index"]]] = {
+                "Sentiment": result["Sentiment"],
+                "SentimentScore": result["SentimentScore"]
+            }
+        
+        for error in response["ErrorList"]:
+            logger.error(f"Comprehend failed for text {start + error['Index']}: {error.get('ErrorMessage')}")
+            unique_sentiments[batch_texts[error["Index"]]] = UNKNOWN_SENTIMENT
+    
+    return [unique_sentiments[text] for text in texts]
+
+def classify_content_types_parallel(texts):
+    """
+    Classify texts concurrently; each SageMaker invocation is I/O bound.
+    
+    Args:
+        texts (list): Texts to classify
+    
+    Returns:
+        list: One classification result per input text, in input order
+    """
+    results = [None] * len(texts)
+    
+    with ThreadPoolExecutor(max_workers=SAGEMAKER_MAX_WORKERS) as executor:
+        futures = {executor.submit(classify_content_type, text): i for i, text in enumerate(texts)}
+        
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                content_type_result = future.result()
+                results[i] = content_type_result
+                logger.info(f"Content type classification: {content_type_result['Classification']} (confidence: {content_type_result['Confidence']:.3f})")
+            except Exception as e:
+                logger.error(f"SageMaker classification failed: {str(e)}")
+                # Add fallback classification
+                results[i] = {
+                    "Classification": "UNKNOWN",
+                    "Confidence": 0.0,
+                    "Error": str(e)
+                }
+    
+    return results
+
 def classify_content_type(text):
     """
     Classify text as informative or emotional using SageMaker endpoint.
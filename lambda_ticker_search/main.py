@@ -1,21 +1,41 @@
 import os
-import json
+import orjson
+import gzip
+import base64
 import boto3
+from botocore.config import Config
+import praw
 import requests
 from datetime import datetime, timedelta
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 # --- AWS Clients ---
-s3_client = boto3.client("s3")
-secrets_client = boto3.client("secretsmanager")
-comprehend_client = boto3.client("comprehend")
+# Shared by all clients; the pool is well above the thread fan-out so connections are
+# kept warm instead of being discarded when the default pool of 10 fills up
+boto_config = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={"max_attempts": 5, "mode": "adaptive"}
+)
+
+secrets_client = boto3.client("secretsmanager", config=boto_config)
+comprehend_client = boto3.client("comprehend", config=boto_config)
+dynamodb_client = boto3.client("dynamodb", config=boto_config)
 
 # --- Configuration ---
 REDDIT_USER_AGENT = os.environ.get("REDDIT_USER_AGENT", "sentiment-analyzer by /u/your-username")
 SUBREDDITS = ["stocks", "investing", "wallstreetbets", "SecurityAnalysis", "ValueInvesting"]
 IGNORE_KEYWORDS = ["yolo", "gain", "loss", "portfolio", "bought", "sold", "trade"]
+# Single case-insensitive alternation scan instead of one substring search per keyword
+IGNORE_KEYWORD_PATTERN = re.compile('|'.join(re.escape(kw) for kw in IGNORE_KEYWORDS), re.IGNORECASE)
+TICKER_PATTERN = re.compile(r'^[A-Z]{1,5}$')
 COMPREHEND_LANGUAGE = "en"
+# BatchDetectSentiment accepts at most 25 documents of up to 5000 UTF-8 bytes each
+COMPREHEND_BATCH_SIZE = 25
+COMPREHEND_MAX_TEXT_BYTES = 5000
+COMPREHEND_MAX_WORKERS = 8
 
 # Filter settings
 MIN_POST_SCORE = 5
@@ -24,8 +44,18 @@ MIN_COMMENT_SCORE = 3
 MIN_COMMENT_LENGTH = 30
 POST_LIMIT = 50
 
-# Rate limiting in-memory storage (simple approach)
-request_counts = {}
+# Responses at least this large are gzipped when the client accepts it
+GZIP_MIN_BYTES = 1024
+
+# Rate limiting: fixed hourly window per IP, counted in DynamoDB so all containers share it
+RATE_LIMIT_TABLE = os.environ.get("RATE_LIMIT_TABLE")
+RATE_LIMIT_PER_HOUR = 10
+
+# Cached across warm invocations
+REDDIT_CREDENTIALS_TTL_SECONDS = 3600
+reddit_credentials = None
+reddit_credentials_loaded_at = 0
+reddit_client = None
 
 # --- Helper Functions ---
 
@@ -38,7 +68,7 @@ def validate_ticker(ticker):
     ticker = ticker.strip().upper()
     
     # Check if it's 1-5 uppercase letters
-    if not re.match(r'^[A-Z]{1,5}$', ticker):
+    if not TICKER_PATTERN.match(ticker):
         return False
     
     return ticker
@@ -58,74 +88,125 @@ def get_timeframe_hours(timeframe):
 
 def check_rate_limit(ip_address):
     """Simple rate limiting - 10 requests per hour per IP"""
-    current_time = time.time()
-    hour_ago = current_time - 3600  # 1 hour ago
-    
-    if ip_address not in request_counts:
-        request_counts[ip_address] = []
-    
-    # Remove old requests
-    request_counts[ip_address] = [req_time for req_time in request_counts[ip_address] if req_time > hour_ago]
+    if not RATE_LIMIT_TABLE:
+        return True
     
-    # Check if limit exceeded
-    if len(request_counts[ip_address]) >= 10:
-        return False
+    hour_bucket = int(time.time() // 3600)
+    try:
+        # Atomic increment; the item expires an hour after its window closes
+        response = dynamodb_client.update_item(
+            TableName=RATE_LIMIT_TABLE,
+            Key={'rate_key': {'S': f"{ip_address}#{hour_bucket}"}},
+            UpdateExpression='ADD request_count :one SET expires_at = if_not_exists(expires_at, :expires_at)',
+            ExpressionAttributeValues={
+                ':one': {'N': '1'},
+                ':expires_at': {'N': str(hour_bucket * 3600 + 7200)}
+            },
+            ReturnValues='UPDATED_NEW'
+        )
+    except Exception as e:
+        # Fail open so a DynamoDB problem doesn't take the endpoint down
+        print(f"Rate limit check failed for {ip_address}: {e}")
+        return True
     
-    # Add current request
-    request_counts[ip_address].append(current_time)
-    return True
+    return int(response['Attributes']['request_count']['N']) <= RATE_LIMIT_PER_HOUR
 
 def get_reddit_credentials():
     """Retrieves Reddit credentials from AWS Secrets Manager"""
+    global reddit_credentials, reddit_credentials_loaded_at, reddit_client
+    if reddit_credentials is not None and time.time() - reddit_credentials_loaded_at < REDDIT_CREDENTIALS_TTL_SECONDS:
+        return reddit_credentials
+    
     secret_name = os.environ.get("REDDIT_SECRET_NAME")
     if not secret_name:
         raise ValueError("REDDIT_SECRET_NAME environment variable not set")
     
     response = secrets_client.get_secret_value(SecretId=secret_name)
-    secret = json.loads(response['SecretString'])
-    return secret['client_id'], secret['client_secret']
+    secret = orjson.loads(response['SecretString'])
+    credentials = (secret['client_id'], secret['client_secret'])
+    if credentials != reddit_credentials:
+        # Rotated secret: drop the client built with the old credentials
+        reddit_client = None
+    reddit_credentials = credentials
+    reddit_credentials_loaded_at = time.time()
+    return reddit_credentials
 
-def search_reddit_posts(reddit, ticker, hours_back):
+def get_reddit_client():
+    """Return the cached PRAW client, creating it on first use"""
+    global reddit_client
+    client_id, client_secret = get_reddit_credentials()
+    if reddit_client is None:
+        reddit_client = praw.Reddit(
+            client_id=client_id,
+            client_secret=client_secret,
+            user_agent=REDDIT_USER_AGENT
+        )
+    return reddit_client
+
+def get_search_time_filter(hours_back):
+    """Smallest Reddit search time filter that covers the requested timeframe"""
+    if hours_back <= 1:
+        return 'hour'
+    if hours_back <= 24:
+        return 'day'
+    if hours_back <= 168:
+        return 'week'
+    return 'month'
+
+def search_reddit_posts(ticker, hours_back):
     """Search Reddit for posts containing the ticker"""
     cutoff_time = time.time() - (hours_back * 3600)
     found_posts = []
     
-    for sub_name in SUBREDDITS:
-        try:
-            subreddit = reddit.subreddit(sub_name)
+    # Whole-word match so e.g. "TSLA" doesn't match inside "UTSLAND"
+    ticker_pattern = re.compile(rf'\b{re.escape(ticker)}\b', re.IGNORECASE)
+    
+    try:
+        reddit = get_reddit_client()
+        # One server-side search across all subreddits instead of scanning each one's new posts
+        subreddits = reddit.subreddit("+".join(SUBREDDITS))
+        posts = subreddits.search(
+            f'"{ticker}"',
+            sort='new',
+            time_filter=get_search_time_filter(hours_back),
+            limit=POST_LIMIT * 3
+        )
+        
+        for post in posts:
+            if post.created_utc < cutoff_time:
+                continue
+            
+            # Cheap numeric filters first, so rejected posts never build the combined text
+            if post.score < MIN_POST_SCORE:
+                continue
+            if len(post.selftext) < MIN_POST_LENGTH:
+                continue
+            
+            # Search matching is loose, so confirm the ticker appears as a word;
+            # the combined text is built once and shared by both regex scans
+            post_text = f"{post.title} {post.selftext}"
+            if not ticker_pattern.search(post_text):
+                continue
+            if IGNORE_KEYWORD_PATTERN.search(post_text):
+                continue
+            
+            sub_name = post.subreddit.display_name
             
-            # Search recent posts
-            for post in subreddit.new(limit=200):
-                if post.created_utc < cutoff_time:
-                    continue
-                
-                # Check if post contains ticker
-                post_text = (post.title + " " + post.selftext).lower()
-                if ticker.lower() not in post_text:
-                    continue
-                
-                # Apply filters
-                if any(kw.lower() in post_text for kw in IGNORE_KEYWORDS):
-                    continue
-                if post.score < MIN_POST_SCORE:
-                    continue
-                if len(post.selftext) < MIN_POST_LENGTH:
-                    continue
-                
-                # Add post
-                found_posts.append({
-                    "type": "post",
-                    "id": post.id,
-                    "title": post.title,
-                    "selftext": post.selftext,
-                    "url": post.url,
-                    "subreddit": sub_name,
-                    "created_utc": post.created_utc,
-                    "score": post.score,
-                    "num_comments": post.num_comments
-                })
-                
-                # Add comments
+            # Add post
+            found_posts.append({
+                "type": "post",
+                "id": post.id,
+                "title": post.title,
+                "selftext": post.selftext,
+                "url": post.url,
+                "subreddit": sub_name,
+                "created_utc": post.created_utc,
+                "score": post.score,
+                "num_comments": post.num_comments
+            })
+            
+            # Add comments (skip the comment fetch entirely when there are none)
+            if post.num_comments > 0:
                 try:
                     post.comments.replace_more(limit=0)
                     for comment in post.comments.list()[:10]:  # Limit comments per post
@@ -143,63 +224,79 @@ def search_reddit_posts(reddit, ticker, hours_back):
                             "created_utc": comment.created_utc,
                             "score": comment.score
                         })
-                except:
+                except Exception:
                     # Skip comments if there's an error
-                    continue
-                
-                if len(found_posts) >= POST_LIMIT:
-                    break
+                    pass
             
             if len(found_posts) >= POST_LIMIT:
                 break
-                
-        except Exception as e:
-            print(f"Error searching subreddit {sub_name}: {e}")
-            continue
+            
+    except Exception as e:
+        print(f"Error searching subreddits for {ticker}: {e}")
     
     return found_posts
 
+def truncate_utf8(text, max_bytes):
+    """Truncate text so its UTF-8 encoding fits in max_bytes without splitting a character"""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode('utf-8', errors='ignore')
+
 def analyze_sentiment(items):
-    """Analyze sentiment for all items"""
+    """Analyze sentiment for all items using batched Comprehend calls"""
     analyzed_items = []
+    texts = []
     
     for item in items:
-        try:
-            # Get text to analyze
-            text_to_analyze = ""
-            if item.get("type") == "post":
-                text_to_analyze = item.get("title", "") + " " + item.get("selftext", "")
-            elif item.get("type") == "comment":
-                text_to_analyze = item.get("body", "")
-            
-            if not text_to_analyze.strip():
-                continue
-            
-            # Truncate text if too long (Comprehend has limits)
-            if len(text_to_analyze) > 5000:
-                text_to_analyze = text_to_analyze[:5000]
-            
-            # Analyze sentiment
-            sentiment_response = comprehend_client.detect_sentiment(
-                Text=text_to_analyze,
-                LanguageCode=COMPREHEND_LANGUAGE
-            )
-            
-            # Add sentiment to item
-            item["sentiment"] = {
-                "Sentiment": sentiment_response["Sentiment"],
-                "SentimentScore": sentiment_response["SentimentScore"]
-            }
-            
-            analyzed_items.append(item)
-            
-        except Exception as e:
-            print(f"Error analyzing sentiment for item {item.get('id')}: {e}")
-            # Add item without sentiment
-            analyzed_items.append(item)
+        # Get text to analyze
+        text_to_analyze = ""
+        if item.get("type") == "post":
+            text_to_analyze = item.get("title", "") + " " + item.get("selftext", "")
+        elif item.get("type") == "comment":
+            text_to_analyze = item.get("body", "")
+        
+        if not text_to_analyze.strip():
+            continue
+        
+        analyzed_items.append(item)
+        texts.append(truncate_utf8(text_to_analyze, COMPREHEND_MAX_TEXT_BYTES))
+    
+    # Batches are independent network calls, so run them concurrently on the shared client
+    starts = range(0, len(texts), COMPREHEND_BATCH_SIZE)
+    with ThreadPoolExecutor(max_workers=COMPREHEND_MAX_WORKERS) as executor:
+        list(executor.map(
+            lambda start: detect_sentiment_batch(
+                analyzed_items[start:start + COMPREHEND_BATCH_SIZE],
+                texts[start:start + COMPREHEND_BATCH_SIZE]
+            ),
+            starts
+        ))
     
     return analyzed_items
 
+def detect_sentiment_batch(batch_items, batch_texts):
+    """Attach Comprehend sentiment to one batch of up to 25 items"""
+    try:
+        response = comprehend_client.batch_detect_sentiment(
+            TextList=batch_texts,
+            LanguageCode=COMPREHEND_LANGUAGE
+        )
+    except Exception as e:
+        # Items in a failed batch are returned without sentiment
+        print(f"Error analyzing sentiment for batch starting at item {batch_items[0].get('id')}: {e}")
+        return
+    
+    # Add sentiment to items
+    for result in response["ResultList"]:
+        batch_items[result["Index"]]["sentiment"] = {
+            "Sentiment": result["Sentiment"],
+            "SentimentScore": result["SentimentScore"]
+        }
+    
+    for error in response["ErrorList"]:
+        print(f"Error analyzing sentiment for item {batch_items[error['Index']].get('id')}: {error.get('ErrorMessage')}")
+
 def calculate_summary_stats(items):
     """Calculate summary statistics"""
     if not items:
@@ -212,39 +309,70 @@ def calculate_summary_stats(items):
             "timeframe_coverage": "No data"
         }
     
-    posts = [item for item in items if item.get("type") == "post"]
-    comments = [item for item in items if item.get("type") == "comment"]
-    
-    # Sentiment breakdown
+    # Single pass over the items
+    post_count = 0
+    comment_count = 0
     sentiment_counts = {"POSITIVE": 0, "NEGATIVE": 0, "NEUTRAL": 0, "MIXED": 0}
+    score_sum = 0
+    oldest = float('inf')
+    newest = float('-inf')
+    
     for item in items:
+        item_type = item.get("type")
+        if item_type == "post":
+            post_count += 1
+        elif item_type == "comment":
+            comment_count += 1
+        
         if "sentiment" in item:
             sentiment = item["sentiment"]["Sentiment"]
             sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + 1
+        
+        score_sum += item.get("score", 0)
+        
+        created_utc = item.get("created_utc", 0)
+        if created_utc < oldest:
+            oldest = created_utc
+        if created_utc > newest:
+            newest = created_utc
     
-    # Average score
-    scores = [item.get("score", 0) for item in items]
-    avg_score = sum(scores) / len(scores) if scores else 0
+    avg_score = score_sum / len(items)
     
     # Time coverage
-    timestamps = [item.get("created_utc", 0) for item in items]
-    if timestamps:
-        oldest = min(timestamps)
-        newest = max(timestamps)
-        hours_span = (newest - oldest) / 3600
-        timeframe_coverage = f"{hours_span:.1f} hours"
-    else:
-        timeframe_coverage = "No data"
+    hours_span = (newest - oldest) / 3600
+    timeframe_coverage = f"{hours_span:.1f} hours"
     
     return {
         "total_items": len(items),
-        "posts": len(posts),
-        "comments": len(comments),
+        "posts": post_count,
+        "comments": comment_count,
         "sentiment_breakdown": sentiment_counts,
         "average_score": round(avg_score, 2),
         "timeframe_coverage": timeframe_coverage
     }
 
+def accepts_gzip(event):
+    """Check the request's Accept-Encoding header (header names are case-insensitive)"""
+    headers = event.get('headers') or {}
+    return any(name.lower() == 'accept-encoding' and 'gzip' in (value or '').lower() for name, value in headers.items())
+
+def accepts_json(event):
+    """Check the request's Accept header names application/json, the API's only binary media type"""
+    headers = event.get('headers') or {}
+    return any(name.lower() == 'accept' and 'application/json' in (value or '').lower() for name, value in headers.items())
+
+def compress_response(event, response):
+    """Gzip a response body for API Gateway, which expects it base64-encoded"""
+    body = response['body']
+    # API Gateway only decodes base64 bodies back to binary when Accept matches binary_media_types
+    if len(body) < GZIP_MIN_BYTES or not accepts_gzip(event) or not accepts_json(event):
+        return response
+    
+    response['body'] = base64.b64encode(gzip.compress(body.encode('utf-8'), compresslevel=5)).decode('ascii')
+    response['isBase64Encoded'] = True
+    response['headers']['Content-Encoding'] = 'gzip'
+    return response
+
 def lambda_handler(event, context):
     """Main Lambda handler for on-demand ticker search"""
     
@@ -261,9 +389,9 @@ def lambda_handler(event, context):
                     'Access-Control-Allow-Headers': 'Content-Type',
                     'Access-Control-Allow-Methods': 'GET, POST, OPTIONS'
                 },
-                'body': json.dumps({
+                'body': orjson.dumps({
                     'error': 'Rate limit exceeded. Maximum 10 requests per hour.'
-                })
+                }).decode()
             }
         
         # Get parameters
@@ -281,9 +409,9 @@ def lambda_handler(event, context):
                     'Access-Control-Allow-Headers': 'Content-Type',
                     'Access-Control-Allow-Methods': 'GET, POST, OPTIONS'
                 },
-                'body': json.dumps({
+                'body': orjson.dumps({
                     'error': 'Invalid ticker format. Please provide a valid stock ticker (e.g., AAPL, TSLA).'
-                })
+                }).decode()
             }
         
         # Get timeframe in hours
@@ -291,17 +419,8 @@ def lambda_handler(event, context):
         
         print(f"Searching for ticker: {validated_ticker}, timeframe: {timeframe} ({hours_back} hours)")
         
-        # Initialize Reddit client
-        client_id, client_secret = get_reddit_credentials()
-        import praw
-        reddit = praw.Reddit(
-            client_id=client_id,
-            client_secret=client_secret,
-            user_agent=REDDIT_USER_AGENT
-        )
-        
-        # Search Reddit posts
-        posts = search_reddit_posts(reddit, validated_ticker, hours_back)
+        # Search Reddit posts (PRAW clients are reused across warm invocations)
+        posts = search_reddit_posts(validated_ticker, hours_back)
         
         if not posts:
             return {
@@ -311,13 +430,13 @@ def lambda_handler(event, context):
                     'Access-Control-Allow-Headers': 'Content-Type',
                     'Access-Control-Allow-Methods': 'GET, POST, OPTIONS'
                 },
-                'body': json.dumps({
+                'body': orjson.dumps({
                     'ticker': validated_ticker,
                     'timeframe': timeframe,
                     'message': 'No relevant posts found for this ticker in the specified timeframe.',
                     'data': [],
                     'summary': calculate_summary_stats([])
-                })
+                }).decode()
             }
         
         # Analyze sentiment
@@ -326,22 +445,23 @@ def lambda_handler(event, context):
         # Calculate summary statistics
         summary = calculate_summary_stats(analyzed_posts)
         
-        # Return results
-        return {
+        # Return results (gzipped, since post bodies make this response large)
+        return compress_response(event, {
             'statusCode': 200,
             'headers': {
+                'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS'
             },
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'ticker': validated_ticker,
                 'timeframe': timeframe,
                 'timestamp': datetime.utcnow().isoformat(),
                 'summary': summary,
                 'data': analyzed_posts[:20]  # Return first 20 items to limit response size
-            })
-        }
+            }).decode()
+        })
         
     except Exception as e:
         print(f"Error in lambda_handler: {e}")
@@ -352,7 +472,7 @@ def lambda_handler(event, context):
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS'
             },
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'error': f'Internal server error: {str(e)}'
-            })
+            }).decode()
         }
\ No newline at end of file
@@ -5,16 +5,72 @@ This script uses Gemini API to pre-label Reddit posts as informative or emotiona
 """
 
 import pandas as pd
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import sys
 
 # Configuration
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
+GEMINI_MODEL = "gemini-2.5-flash"
+GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+GEMINI_CACHE_URL = "https://generativelanguage.googleapis.com/v1beta/cachedContents"
+# Explicit context caching needs a prompt prefix above the model's minimum cache size;
+# when disabled (or creation fails) the rubric is sent as a systemInstruction instead
+GEMINI_USE_CONTEXT_CACHE = os.environ.get('GEMINI_USE_CONTEXT_CACHE', 'false').lower() == 'true'
+GEMINI_CACHE_TTL = os.environ.get('GEMINI_CACHE_TTL', '3600s')
+GEMINI_MAX_WORKERS = int(os.environ.get('GEMINI_MAX_WORKERS', 8))
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 60))
+# Posts per Gemini call; ten short labels sit far below the output token cap
+GEMINI_BATCH_SIZE = int(os.environ.get('GEMINI_BATCH_SIZE', 10))
+LABEL_COLUMNS = ['informative_emotional_label', 'labeler', 'labeling_notes']
+
+class TokenBucket:
+    """Thread-safe token-bucket rate limiter: refills at a steady rate and allows bursts up to capacity."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate_per_second)
+                self.last_refill = now
+                
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                
+                wait = (tokens - self.tokens) / self.rate_per_second
+            time.sleep(wait)
+
+gemini_limiter = TokenBucket(GEMINI_REQUESTS_PER_MINUTE, GEMINI_MAX_WORKERS)
+
+# One keep-alive session shared by all workers so TLS handshakes are paid once per connection.
+# 429s are left to classify_with_gemini, which backs off for a full minute.
+gemini_session = requests.Session()
+gemini_session.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset(['POST'])
+    )
+))
 
 def check_setup():
     """Check if API key is configured"""
@@ -30,17 +86,7 @@ def check_setup():
         return False
     return True
 
-def classify_with_gemini(text, retry_count=0):
-    """Use Gemini 2.5 Flash to classify a Reddit post"""
-    if retry_count > 3:
-        return "error"
-    
-    # Truncate text to avoid token limits
-    text = text[:800] if len(text) > 800 else text
-    
-    prompt = f"""You are a financial content classifier. Classify this Reddit post as either "informative" or "emotional".
-
-INFORMATIVE posts contain:
+CLASSIFICATION_CRITERIA = """INFORMATIVE posts contain:
 - Factual information, news, earnings reports
 - Market data, analysis, financial metrics  
 - Company announcements, SEC filings
@@ -52,12 +98,79 @@ EMOTIONAL posts contain:
 - Excitement, frustration, hope, fear
 - Memes, slang like "moon", "diamond hands", "YOLO"
 - Personal trading experiences
-- Subjective commentary without data
+- Subjective commentary without data"""
 
-Post text: "{text}"
+# Constant prompt prefix shared by every call; only the posts change per request
+SYSTEM_INSTRUCTION = f"""You are a financial content classifier. Classify Reddit posts as either "informative" or "emotional".
 
-Respond with ONLY ONE WORD: either "informative" or "emotional" """
+{CLASSIFICATION_CRITERIA}"""
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_ONLY_HIGH"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH", 
+        "threshold": "BLOCK_ONLY_HIGH"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_ONLY_HIGH"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_ONLY_HIGH"
+    }
+]
 
+def truncate_post(text):
+    """Truncate text to avoid token limits"""
+    return text[:800] if len(text) > 800 else text
+
+cached_content_name = None
+cached_content_lock = threading.Lock()
+
+def get_prompt_context():
+    """
+    Return the payload fields carrying the static rubric: a cachedContent reference when
+    context caching is enabled and the cache could be created, otherwise a systemInstruction.
+    """
+    global cached_content_name, GEMINI_USE_CONTEXT_CACHE
+    system_instruction = {"systemInstruction": {"parts": [{"text": SYSTEM_INSTRUCTION}]}}
+    if not GEMINI_USE_CONTEXT_CACHE:
+        return system_instruction
+    
+    with cached_content_lock:
+        if cached_content_name is None and GEMINI_USE_CONTEXT_CACHE:
+            try:
+                response = gemini_session.post(
+                    GEMINI_CACHE_URL,
+                    params={'key': GEMINI_API_KEY},
+                    json={
+                        "model": f"models/{GEMINI_MODEL}",
+                        "systemInstruction": system_instruction["systemInstruction"],
+                        "ttl": GEMINI_CACHE_TTL
+                    },
+                    timeout=30
+                )
+                response.raise_for_status()
+                cached_content_name = response.json()['name']
+                print(f"Created Gemini context cache: {cached_content_name}")
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                print(f"Context cache unavailable ({e}), sending the rubric with each request")
+                GEMINI_USE_CONTEXT_CACHE = False
+                return system_instruction
+    
+    if cached_content_name is None:
+        return system_instruction
+    return {"cachedContent": cached_content_name}
+
+def request_gemini(prompt, generation_config, retry_count=0):
+    """Send a prompt to Gemini; returns the response text, or None on failure"""
+    if retry_count > 3:
+        return None
+    
     headers = {
         "Content-Type": "application/json"
     }
@@ -68,34 +181,16 @@ Respond with ONLY ONE WORD: either "informative" or "emotional" """
                 "text": prompt
             }]
         }],
-        "generationConfig": {
-            "temperature": 0.1,
-            "topK": 1,
-            "topP": 0.8
-        },
-        "safetySettings": [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_ONLY_HIGH"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH", 
-                "threshold": "BLOCK_ONLY_HIGH"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_ONLY_HIGH"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_ONLY_HIGH"
-            }
-        ]
+        "generationConfig": generation_config,
+        "safetySettings": SAFETY_SETTINGS,
+        **get_prompt_context()
     }
     
     try:
-        response = requests.post(
-            f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
+        gemini_limiter.acquire()
+        response = gemini_session.post(
+            GEMINI_API_URL,
+            params={'key': GEMINI_API_KEY},
             headers=headers,
             json=payload,
             timeout=30
@@ -114,36 +209,27 @@ Respond with ONLY ONE WORD: either "informative" or "emotional" """
                 # Check if response was cut off due to MAX_TOKENS
                 if candidate.get('finishReason') == 'MAX_TOKENS':
                     print(f"Response truncated due to MAX_TOKENS. Increase maxOutputTokens.")
-                    return 'error'
+                    return None
                 
                 # Handle different response structures
                 try:
                     if 'content' in candidate and 'parts' in candidate['content']:
-                        content = candidate['content']['parts'][0]['text'].strip().lower()
+                        return candidate['content']['parts'][0]['text']
                     elif 'text' in candidate:
-                        content = candidate['text'].strip().lower()
+                        return candidate['text']
                     elif 'output' in candidate:
-                        content = candidate['output'].strip().lower()
+                        return candidate['output']
                     else:
                         print(f"Unexpected candidate structure: {candidate}")
-                        return 'error'
-                    
-                    # Clean up the response
-                    if 'informative' in content:
-                        return 'informative'
-                    elif 'emotional' in content:
-                        return 'emotional'
-                    else:
-                        print(f"Unexpected response content: {content}")
-                        return 'unknown'
+                        return None
                         
                 except KeyError as e:
                     print(f"KeyError accessing response: {e}")
                     print(f"Full candidate structure: {candidate}")
-                    return 'error'
+                    return None
             else:
                 print(f"No candidates in response: {result}")
-                return 'error'
+                return None
         else:
             print(f"API Error {response.status_code}: {response.text}")
             
@@ -151,14 +237,72 @@ Respond with ONLY ONE WORD: either "informative" or "emotional" """
             if response.status_code == 429:
                 print("Rate limited, waiting 60 seconds...")
                 time.sleep(60)
-                return classify_with_gemini(text, retry_count + 1)
+                return request_gemini(prompt, generation_config, retry_count + 1)
             
-            return 'error'
+            return None
             
     except requests.exceptions.RequestException as e:
         print(f"Request error: {e}")
         time.sleep(5)  # Wait before retry
-        return classify_with_gemini(text, retry_count + 1)
+        return request_gemini(prompt, generation_config, retry_count + 1)
+
+def classify_with_gemini(text):
+    """Use Gemini 2.5 Flash to classify a Reddit post"""
+    prompt = f"""Post text: "{truncate_post(text)}"
+
+Respond with ONLY ONE WORD: either "informative" or "emotional" """
+
+    content = request_gemini(prompt, {
+        "temperature": 0.1,
+        "topK": 1,
+        "topP": 0.8
+    })
+    if content is None:
+        return 'error'
+    
+    # Clean up the response
+    content = content.strip().lower()
+    if 'informative' in content:
+        return 'informative'
+    elif 'emotional' in content:
+        return 'emotional'
+    else:
+        print(f"Unexpected response content: {content}")
+        return 'unknown'
+
+def classify_batch_with_gemini(texts):
+    """
+    Classify several Reddit posts in one Gemini call using a JSON array response.
+    Falls back to one call per post if the response can't be parsed or has the wrong length.
+    """
+    numbered_posts = "\n\n".join(f'Post {i}: "{truncate_post(text)}"' for i, text in enumerate(texts, 1))
+    prompt = f"""Classify each of the following posts.
+
+{numbered_posts}
+
+Respond with a JSON array containing exactly {len(texts)} labels, one per post in order."""
+
+    content = request_gemini(prompt, {
+        "temperature": 0.1,
+        "topK": 1,
+        "topP": 0.8,
+        "responseMimeType": "application/json",
+        "responseSchema": {
+            "type": "array",
+            "items": {"type": "string", "enum": ["informative", "emotional"]}
+        }
+    })
+    
+    if content is not None:
+        try:
+            labels = [str(label).strip().lower() for label in json.loads(content)]
+            if len(labels) == len(texts):
+                return labels
+            print(f"Batch response had {len(labels)} labels for {len(texts)} posts, labeling individually")
+        except (ValueError, TypeError) as e:
+            print(f"Could not parse batch response ({e}), labeling individually")
+    
+    return [classify_with_gemini(text) for text in texts]
 
 def test_api():
     """Test API with a simple example"""
@@ -216,33 +360,42 @@ def main():
     df.to_csv(backup_file, index=False)
     print(f"💾 Created backup: {backup_file}")
     
-    for idx, row in unlabeled_posts.iterrows():
-        if pd.isna(row['informative_emotional_label']) or row['informative_emotional_label'] == '':
-            print(f"🔄 Labeling post {labeled_count + 1}/{len(unlabeled_posts)}: ", end="")
-            
-            # Get AI classification
-            label = classify_with_gemini(row['text'])
-            
-            if label in ['informative', 'emotional']:
-                df.at[idx, 'informative_emotional_label'] = label
-                df.at[idx, 'labeler'] = 'gemini-2.5-flash'
-                df.at[idx, 'labeling_notes'] = f'AI labeled on {datetime.now().strftime("%Y-%m-%d %H:%M")}'
-                labeled_count += 1
-                print(f"SUCCESS: {label}")
-            else:
-                df.at[idx, 'informative_emotional_label'] = 'needs_review'
-                df.at[idx, 'labeler'] = 'gemini-error'
-                error_count += 1
-                print(f"ERROR: classification failed")
-            
-            # Save progress every 50 posts
-            if labeled_count % 50 == 0 and labeled_count > 0:
-                progress_file = f"progress_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{base_filename}.csv"
-                df.to_csv(progress_file, index=False)
-                print(f"Auto-saved progress: {progress_file}")
-            
-            # Rate limiting - be nice to the API
-            time.sleep(1)  # 1 second between requests
+    # Results are collected into arrays and written back to the DataFrame in one assignment
+    label_values = {col: df[col].to_numpy(dtype=object, copy=True) if col in df else np.full(len(df), None, dtype=object)
+                    for col in LABEL_COLUMNS}
+    positions = np.flatnonzero(unlabeled_mask.to_numpy())
+    texts = df['text'].to_numpy()
+    
+    with ThreadPoolExecutor(max_workers=GEMINI_MAX_WORKERS) as executor:
+        batches = [positions[start:start + GEMINI_BATCH_SIZE] for start in range(0, len(positions), GEMINI_BATCH_SIZE)]
+        futures = {executor.submit(classify_batch_with_gemini, list(texts[batch])): batch for batch in batches}
+        
+        for future in as_completed(futures):
+            labeling_note = f'AI labeled on {datetime.now().strftime("%Y-%m-%d %H:%M")}'
+            for pos, label in zip(futures[future], future.result()):
+                print(f"🔄 Labeled post {labeled_count + error_count + 1}/{len(unlabeled_posts)}: ", end="")
+                
+                if label in ['informative', 'emotional']:
+                    label_values['informative_emotional_label'][pos] = label
+                    label_values['labeler'][pos] = 'gemini-2.5-flash'
+                    label_values['labeling_notes'][pos] = labeling_note
+                    labeled_count += 1
+                    print(f"SUCCESS: {label}")
+                else:
+                    label_values['informative_emotional_label'][pos] = 'needs_review'
+                    label_values['labeler'][pos] = 'gemini-error'
+                    error_count += 1
+                    print(f"ERROR: classification failed")
+                    continue
+                
+                # Save progress every 50 posts
+                if labeled_count % 50 == 0:
+                    progress_file = f"progress_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{base_filename}.csv"
+                    df.assign(**label_values).to_csv(progress_file, index=False)
+                    print(f"Auto-saved progress: {progress_file}")
+    
+    for col in LABEL_COLUMNS:
+        df[col] = label_values[col]
     
     # Final save
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
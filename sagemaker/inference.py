@@ -4,17 +4,30 @@ SageMaker Inference Script for Informative vs Emotional Classification
 This script handles real-time inference for the trained BERT model.
 """
 
-import json
+import orjson
 import logging
 import os
 import torch
 import numpy as np
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# INT8 model written by train.py --export-onnx, relative to the model directory
+ONNX_MODEL_PATH = os.path.join('onnx', 'model_quantized.onnx')
+
+# Texts are sorted by token length and run in buckets of this size, so each
+# forward pass only pads to the longest text among similar-length neighbours
+INFERENCE_BUCKET_SIZE = int(os.environ.get('INFERENCE_BUCKET_SIZE', 8))
+MAX_SEQUENCE_LENGTH = 512
+
 class ModelHandler:
     """
     Custom model handler for SageMaker inference
@@ -22,11 +35,34 @@ class ModelHandler:
     
     def __init__(self):
         self.model = None
+        self.session = None
         self.tokenizer = None
         self.label_mapping = None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         logger.info(f"Using device: {self.device}")
 
+def cpu_supports_bf16():
+    """
+    Check whether the host CPU has native BF16 instructions (AVX512-BF16 or AMX).
+    Without them BF16 matmuls are emulated and slower than FP32.
+    """
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+def get_inference_dtype(device):
+    """
+    Pick the model dtype: FP16 on GPU, BF16 on CPUs with native support, FP32 otherwise.
+    """
+    if device.type == 'cuda':
+        return torch.float16
+    if cpu_supports_bf16():
+        return torch.bfloat16
+    return torch.float32
+
 def model_fn(model_dir):
     """
     Load the model and tokenizer from the model directory.
@@ -38,22 +74,41 @@ def model_fn(model_dir):
         # Load the tokenizer
         tokenizer = AutoTokenizer.from_pretrained(model_dir)
         
-        # Load the model
-        model = AutoModelForSequenceClassification.from_pretrained(model_dir)
-        model.eval()  # Set to evaluation mode
-        
-        # Move to appropriate device
+        # On CPU hosts prefer the INT8 ONNX model when it was exported at training time
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        model.to(device)
+        onnx_path = os.path.join(model_dir, ONNX_MODEL_PATH)
+        session = None
+        model = None
+        if device.type == 'cpu' and ort is not None and os.path.exists(onnx_path):
+            session_options = ort.SessionOptions()
+            session_options.intra_op_num_threads = os.cpu_count()
+            session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(onnx_path, sess_options=session_options, providers=['CPUExecutionProvider'])
+            logger.info(f"Using ONNX Runtime INT8 model: {onnx_path}")
+        else:
+            # Load the model
+            model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+            model.eval()  # Set to evaluation mode
+            
+            # Move to appropriate device, in reduced precision where the hardware supports it
+            model.to(device)
+            inference_dtype = get_inference_dtype(device)
+            if inference_dtype != torch.float32:
+                model.to(inference_dtype)
+            logger.info(f"Inference dtype: {inference_dtype}")
         
         # Load label mapping
         label_mapping_path = os.path.join(model_dir, 'label_mapping.json')
-        with open(label_mapping_path, 'r') as f:
-            label_mapping = json.load(f)
+        with open(label_mapping_path, 'rb') as f:
+            label_mapping = orjson.loads(f.read())
+        
+        # JSON object keys are strings; convert class ids back to ints once at load time
+        label_mapping['reverse_label_map'] = {int(k): v for k, v in label_mapping['reverse_label_map'].items()}
         
         # Create model handler
         handler = ModelHandler()
         handler.model = model
+        handler.session = session
         handler.tokenizer = tokenizer
         handler.label_mapping = label_mapping
         
@@ -78,7 +133,7 @@ def input_fn(request_body, request_content_type):
     logger.info(f"Received content type: {request_content_type}")
     
     if request_content_type == 'application/json':
-        input_data = json.loads(request_body)
+        input_data = orjson.loads(request_body)
         
         # Handle different input formats
         if isinstance(input_data, dict):
@@ -124,48 +179,32 @@ def predict_fn(input_data, model_handler):
         tokenizer = model_handler.tokenizer
         reverse_label_map = model_handler.label_mapping['reverse_label_map']
         
-        # Convert string keys back to int keys
-        reverse_label_map = {int(k): v for k, v in reverse_label_map.items()}
+        # Tokenize once without padding; each bucket is padded separately below
+        encoded = tokenizer(list(input_data), truncation=True, max_length=MAX_SEQUENCE_LENGTH)
+        order = sorted(range(len(input_data)), key=lambda i: len(encoded['input_ids'][i]))
         
-        predictions = []
+        probabilities = [None] * len(input_data)
+        for start in range(0, len(order), INFERENCE_BUCKET_SIZE):
+            bucket = order[start:start + INFERENCE_BUCKET_SIZE]
+            features = {key: [encoded[key][i] for i in bucket] for key in encoded.keys()}
+            
+            if model_handler.session is not None:
+                bucket_probabilities = predict_onnx(model_handler.session, tokenizer, features)
+            else:
+                bucket_probabilities = predict_torch(model, tokenizer, features, model_handler.device)
+            
+            # Scatter back to the original request order
+            for i, class_probs in zip(bucket, bucket_probabilities.tolist()):
+                probabilities[i] = class_probs
         
-        # Process each text
-        with torch.no_grad():
-            for text in input_data:
-                # Tokenize input
-                inputs = tokenizer(
-                    text,
-                    truncation=True,
-                    padding='max_length',
-                    max_length=512,
-                    return_tensors='pt'
-                )
-                
-                # Move to device
-                inputs = {k: v.to(model_handler.device) for k, v in inputs.items()}
-                
-                # Run inference
-                outputs = model(**inputs)
-                logits = outputs.logits
-                
-                # Get prediction probabilities
-                probabilities = torch.softmax(logits, dim=-1)
-                predicted_class = torch.argmax(logits, dim=-1).item()
-                confidence = probabilities[0][predicted_class].item()
-                
-                # Get all class probabilities
-                class_probabilities = {
-                    reverse_label_map[i]: prob.item() 
-                    for i, prob in enumerate(probabilities[0])
-                }
-                
-                prediction = {
-                    'predicted_class': reverse_label_map[predicted_class],
-                    'confidence': confidence,
-                    'probabilities': class_probabilities
-                }
-                
-                predictions.append(prediction)
+        predictions = []
+        for class_probs in probabilities:
+            predicted_class = max(range(len(class_probs)), key=class_probs.__getitem__)
+            predictions.append({
+                'predicted_class': reverse_label_map[predicted_class],
+                'confidence': class_probs[predicted_class],
+                'probabilities': {reverse_label_map[i]: prob for i, prob in enumerate(class_probs)}
+            })
         
         logger.info(f"Inference completed successfully")
         return predictions
@@ -174,6 +213,49 @@ def predict_fn(input_data, model_handler):
         logger.error(f"Error during inference: {str(e)}")
         raise e
 
+def predict_torch(model, tokenizer, features, device):
+    """
+    Run one padded bucket through the PyTorch model.
+    
+    Args:
+        model: The loaded sequence classification model
+        tokenizer: Tokenizer matching the model
+        features: Unpadded tokenizer output for the bucket
+        device: Device the model lives on
+    
+    Returns:
+        Tensor of class probabilities, one row per text
+    """
+    inputs = tokenizer.pad(features, return_tensors='pt').to(device)
+    
+    with torch.inference_mode():
+        # Copy the small logits tensor off the device right away so the batch's device
+        # memory is released; softmax runs on CPU in FP32 for stable probabilities
+        logits = model(**inputs).logits.float().cpu()
+    return torch.softmax(logits, dim=-1)
+
+def predict_onnx(session, tokenizer, features):
+    """
+    Run one padded bucket through the ONNX Runtime session.
+    
+    Args:
+        session: onnxruntime.InferenceSession for the exported model
+        tokenizer: Tokenizer matching the model
+        features: Unpadded tokenizer output for the bucket
+    
+    Returns:
+        numpy array of class probabilities, one row per text
+    """
+    encoded = tokenizer.pad(features, return_tensors='np')
+    # Feed only the inputs the exported graph declares (DistilBERT has no token_type_ids)
+    feed = {graph_input.name: encoded[graph_input.name].astype(np.int64) for graph_input in session.get_inputs()}
+    logits = session.run(None, feed)[0].astype(np.float32)
+    
+    # Numerically stable softmax
+    logits -= logits.max(axis=-1, keepdims=True)
+    exp_logits = np.exp(logits)
+    return exp_logits / exp_logits.sum(axis=-1, keepdims=True)
+
 def output_fn(prediction, accept):
     """
     Format the prediction output.
@@ -190,15 +272,15 @@ def output_fn(prediction, accept):
     if accept == 'application/json':
         if len(prediction) == 1:
             # Single prediction
-            return json.dumps(prediction[0])
+            return orjson.dumps(prediction[0])
         else:
             # Multiple predictions
-            return json.dumps({
+            return orjson.dumps({
                 'predictions': prediction
             })
     else:
         # Default to JSON
-        return json.dumps(prediction)
+        return orjson.dumps(prediction)
 
 # Health check function for SageMaker endpoints
 def ping():
@@ -7,11 +7,16 @@ import boto3
 import sagemaker
 from sagemaker.pytorch import PyTorch
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
 
 # Configuration
 TRAINING_DATA_S3_PATH = "s3://altdata-sagemaker-training-data/labeled/training_data_final.csv"
 MODEL_OUTPUT_PATH = "s3://altdata-sagemaker-models/"
+# DistilBERT fine-tuning is matmul-bound, so a T4 GPU instance finishes far faster than CPU
+TRAINING_INSTANCE_TYPE = os.environ.get("TRAINING_INSTANCE_TYPE", "ml.g4dn.xlarge")
+# Synced with /opt/ml/checkpoints in the container; holds the tokenized dataset cache across jobs
+CHECKPOINT_S3_PATH = "s3://altdata-sagemaker-models/checkpoints/informative-emotional/"
 SAGEMAKER_ROLE = "arn:aws:iam::ACCOUNT_ID:role/sagemaker-informative-emotional-execution-role"
 
 def get_account_id():
@@ -19,11 +24,12 @@ def get_account_id():
     sts = boto3.client('sts')
     return sts.get_caller_identity()['Account']
 
-def launch_training():
+def launch_training(account_id=None):
     """Launch SageMaker training job"""
     
     # Get account ID and build role ARN
-    account_id = get_account_id()
+    if account_id is None:
+        account_id = get_account_id()
     role_arn = f"arn:aws:iam::{account_id}:role/sagemaker-informative-emotional-execution-role"
     
     print(f"Launching SageMaker training job...")
@@ -42,24 +48,32 @@ def launch_training():
         entry_point='train.py',
         source_dir='./sagemaker',
         role=role_arn,
-        instance_type='ml.m5.xlarge',  # Start with CPU instance
+        instance_type=TRAINING_INSTANCE_TYPE,
         instance_count=1,
-        framework_version='1.12.0',
-        py_version='py38',
+        framework_version='2.1.0',  # torch 2.x: torch.compile, fused AdamW, SDPA attention
+        py_version='py310',
         job_name=job_name,
         output_path=MODEL_OUTPUT_PATH,
+        checkpoint_s3_uri=CHECKPOINT_S3_PATH,
         
         # Hyperparameters
         hyperparameters={
             'epochs': 3,
             'batch-size': 16,
+            'gradient-accumulation-steps': 4,  # Effective batch size 64
             'learning-rate': '2e-5',
-            'model-name': 'distilbert-base-uncased'
+            'model-name': 'distilbert-base-uncased',
+            'export-onnx': 'true',  # INT8 ONNX model for the CPU serverless endpoint
+            'fp16': 'true'  # Mixed precision; ignored on CPU instances
         },
         
         # Resource configuration
         volume_size=20,  # GB
-        max_run=3600,    # 1 hour max
+        max_run=3600,    # 1 hour max (GPU runs typically finish in well under 30 minutes)
+        
+        # Expose the S3 training data as lazily-read files instead of copying it to the volume
+        # before the container starts; train.py reads the same /opt/ml/input/data/train path
+        input_mode='FastFile',
         
         # Enable network isolation for security
         enable_network_isolation=False,  # Needs internet for model download
@@ -83,8 +97,9 @@ def launch_training():
         print(f"Monitor progress:")
         print(f"   AWS Console: https://console.aws.amazon.com/sagemaker/home#/jobs")
         print(f"   CloudWatch Logs: /aws/sagemaker/TrainingJobs")
-        print(f"\nTraining typically takes 30-90 minutes")
-        print(f"Estimated cost: $2-5 for ml.m5.xlarge")
+        print(f"\nInstance type: {TRAINING_INSTANCE_TYPE}")
+        print(f"Training typically takes 10-20 minutes on ml.g4dn.xlarge (30-90 minutes on ml.m5.xlarge)")
+        print(f"Estimated cost: under $1 for ml.g4dn.xlarge ($2-5 for ml.m5.xlarge)")
         
         return estimator, job_name
         
@@ -123,16 +138,21 @@ def main():
     print("SageMaker Training Job Launcher")
     print("=" * 50)
     
-    # Verify training data exists
+    # Verify training data exists, resolving the account ID concurrently since both are
+    # independent round trips
     print("Checking training data...")
     s3 = boto3.client('s3')
     
+    # Parse S3 path
+    bucket = TRAINING_DATA_S3_PATH.split('/')[2]
+    key = '/'.join(TRAINING_DATA_S3_PATH.split('/')[3:])
+    
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        account_future = executor.submit(get_account_id)
+        head_future = executor.submit(s3.head_object, Bucket=bucket, Key=key)
+    
     try:
-        # Parse S3 path
-        bucket = TRAINING_DATA_S3_PATH.split('/')[2]
-        key = '/'.join(TRAINING_DATA_S3_PATH.split('/')[3:])
-        
-        s3.head_object(Bucket=bucket, Key=key)
+        head_future.result()
         print("Training data found")
         
     except Exception as e:
@@ -141,8 +161,14 @@ def main():
         print("   Use: aws s3 cp your_labeled_file.csv s3://altdata-sagemaker-training-data/labeled/training_data_final.csv")
         return
     
+    try:
+        account_id = account_future.result()
+    except Exception as e:
+        print(f"ERROR: Could not resolve AWS account ID: {e}")
+        return
+    
     # Launch training
-    estimator, job_name = launch_training()
+    estimator, job_name = launch_training(account_id)
     
     if job_name:
         print(f"\nNext steps:")
@@ -12,17 +12,23 @@ import pandas as pd
 import numpy as np
 import pickle
 import json
-from sklearn.model_selection import train_test_split
+import hashlib
+import inspect
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, classification_report
 import torch
 import torch.nn as nn
-from torch.utils.data import Dataset, DataLoader
+from torch.optim import AdamW
+from torch.utils.data import DataLoader
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from datasets import Dataset
 from transformers import (
     AutoTokenizer, 
     AutoModelForSequenceClassification,
-    AdamW,
+    DataCollatorWithPadding,
     get_linear_schedule_with_warmup
 )
+from transformers.trainer_pt_utils import LengthGroupedSampler
 from tqdm import tqdm
 import boto3
 
@@ -30,62 +36,114 @@ import boto3
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class RedditPostDataset(Dataset):
-    """Dataset class for Reddit posts classification"""
+# Columns of the labeled CSV the classifier reads; everything else is skipped at parse time
+TRAINING_CSV_COLUMNS = ['text', 'informative_emotional_label']
+# Seconds between progress bar refreshes; each refresh is a write to CloudWatch
+PROGRESS_MIN_INTERVAL_SECONDS = 5.0
+
+class CUDAPrefetcher:
+    """Iterates a DataLoader while copying the next batch to the GPU on a side stream"""
     
-    def __init__(self, texts, labels, tokenizer, max_length=512):
-        self.texts = texts
-        self.labels = labels
-        self.tokenizer = tokenizer
-        self.max_length = max_length
+    def __init__(self, loader, device):
+        self.loader = loader
+        self.device = device
+        self.stream = torch.cuda.Stream(device=device)
     
     def __len__(self):
-        return len(self.texts)
+        return len(self.loader)
     
-    def __getitem__(self, idx):
-        text = str(self.texts[idx])
-        label = self.labels[idx]
-        
-        encoding = self.tokenizer(
-            text,
-            truncation=True,
-            padding='max_length',
-            max_length=self.max_length,
-            return_tensors='pt'
-        )
-        
-        return {
-            'input_ids': encoding['input_ids'].flatten(),
-            'attention_mask': encoding['attention_mask'].flatten(),
-            'labels': torch.tensor(label, dtype=torch.long)
-        }
+    def preload(self, batches):
+        """Start the host-to-device copy of the next batch, or return None when exhausted"""
+        batch = next(batches, None)
+        if batch is None:
+            return None
+        with torch.cuda.stream(self.stream):
+            return {k: v.to(self.device, non_blocking=True) for k, v in batch.items()}
+    
+    def __iter__(self):
+        batches = iter(self.loader)
+        next_batch = self.preload(batches)
+        while next_batch is not None:
+            torch.cuda.current_stream(self.device).wait_stream(self.stream)
+            batch = next_batch
+            # Tell the caching allocator these tensors are used on the compute stream too
+            for tensor in batch.values():
+                tensor.record_stream(torch.cuda.current_stream(self.device))
+            # Batch N+1 copies while the caller runs forward/backward on batch N
+            next_batch = self.preload(batches)
+            yield batch
 
 class InformativeEmotionalClassifier:
     """Main classifier class"""
     
-    def __init__(self, model_name='distilbert-base-uncased', num_classes=2):
+    def __init__(self, model_name='distilbert-base-uncased', num_classes=2, tokenization_cache_dir=None):
         self.model_name = model_name
         self.num_classes = num_classes
+        self.tokenization_cache_dir = tokenization_cache_dir
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.use_amp = False
+        # BF16 (Ampere+, e.g. g5) has FP32's exponent range so it needs no loss scaling;
+        # FP16 (Turing, e.g. g4dn) does
+        if self.device.type == 'cuda' and torch.cuda.is_bf16_supported():
+            self.amp_dtype = torch.bfloat16
+        else:
+            self.amp_dtype = torch.float16
         
         # Initialize tokenizer and model
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSequenceClassification.from_pretrained(
-            model_name, 
-            num_labels=num_classes
-        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        if not self.tokenizer.is_fast:
+            raise ValueError(f"No fast (Rust) tokenizer available for {model_name}")
+        self.model = self.load_model(model_name, num_classes)
         self.model.to(self.device)
         
+        # Fuse DistilBERT's pointwise ops (LayerNorm, GELU, residual adds) into neighbouring kernels.
+        # torch.compile needs torch 2.0+; older torch runs eagerly. dynamic=True keeps varying
+        # padded lengths from forcing recompiles. save_pretrained still goes through self.model.
+        self.forward_model = self.model
+        if self.device.type == 'cuda' and hasattr(torch, 'compile'):
+            self.forward_model = torch.compile(self.model, dynamic=True)
+        
         # Label mapping
         self.label_map = {'informative': 0, 'emotional': 1}
         self.reverse_label_map = {0: 'informative', 1: 'emotional'}
     
+    @staticmethod
+    def load_model(model_name, num_classes):
+        """Load the classifier with PyTorch's fused scaled_dot_product_attention where supported"""
+        # SDPA serves both the training and evaluation forwards. Padded positions are still
+        # computed under the mask; length-grouped batches keep that padding small.
+        try:
+            model = AutoModelForSequenceClassification.from_pretrained(
+                model_name,
+                num_labels=num_classes,
+                attn_implementation='sdpa'
+            )
+            logger.info("Using SDPA attention")
+            return model
+        except (TypeError, ValueError) as e:
+            # Older transformers releases don't accept attn_implementation, or (before 4.46)
+            # have no SDPA path for DistilBERT
+            logger.info(f"SDPA attention unavailable, using eager attention: {e}")
+        return AutoModelForSequenceClassification.from_pretrained(
+            model_name,
+            num_labels=num_classes
+        )
+    
     def prepare_data(self, data_path):
         """Load and prepare training data"""
         logger.info(f"Loading data from {data_path}")
         
-        # Load CSV data
-        df = pd.read_csv(data_path)
+        # Load only the two columns used, parsed by Arrow's multithreaded CSV reader. Post bodies
+        # contain quoted newlines, which pandas' engine='pyarrow' path can't parse
+        table = pa_csv.read_csv(
+            data_path,
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=TRAINING_CSV_COLUMNS,
+                column_types={column: pa.string() for column in TRAINING_CSV_COLUMNS}
+            )
+        )
+        df = table.to_pandas()
         
         # Filter out unlabeled data
         df = df[df['informative_emotional_label'].notna()]
@@ -97,32 +155,123 @@ class InformativeEmotionalClassifier:
         logger.info(f"Loaded {len(df)} labeled examples")
         
         # Prepare features and labels
-        texts = df['text'].tolist()
-        labels = [self.label_map[label.lower().strip()] for label in df['informative_emotional_label']]
+        data = pd.DataFrame({
+            'text': df['text'].astype(str).to_numpy(),
+            'labels': df['informative_emotional_label'].str.lower().str.strip().map(self.label_map).to_numpy()
+        })
+        dataset = Dataset.from_pandas(data, preserve_index=False)
         
         # Split data
-        train_texts, val_texts, train_labels, val_labels = train_test_split(
-            texts, labels, test_size=0.2, random_state=42, stratify=labels
-        )
+        train_idx, val_idx = self.stratified_split(data['labels'].to_numpy(), test_size=0.2, seed=42)
+        splits = {'train': dataset.select(train_idx), 'test': dataset.select(val_idx)}
         
-        logger.info(f"Training examples: {len(train_texts)}")
-        logger.info(f"Validation examples: {len(val_texts)}")
+        logger.info(f"Training examples: {len(splits['train'])}")
+        logger.info(f"Validation examples: {len(splits['test'])}")
         
-        # Create datasets
-        train_dataset = RedditPostDataset(train_texts, train_labels, self.tokenizer)
-        val_dataset = RedditPostDataset(val_texts, val_labels, self.tokenizer)
+        # Tokenized splits are cached as memory-mapped Arrow files keyed by the input data and
+        # tokenizer, so repeated jobs on an unchanged CSV skip tokenization entirely
+        cache_key = self.tokenization_cache_key(data_path)
+        train_dataset = self.tokenize_split(splits['train'], f"train-{cache_key}")
+        val_dataset = self.tokenize_split(splits['test'], f"val-{cache_key}")
         
         return train_dataset, val_dataset
     
-    def train(self, train_dataset, val_dataset, epochs=3, batch_size=16, learning_rate=2e-5):
+    @staticmethod
+    def stratified_split(labels, test_size=0.2, seed=42):
+        """Row indices for a per-class shuffled split, sorted so selects read rows in file order"""
+        rng = np.random.default_rng(seed)
+        train_parts, val_parts = [], []
+        for label in np.unique(labels):
+            idx = np.flatnonzero(labels == label)
+            rng.shuffle(idx)
+            cut = int(round(len(idx) * (1 - test_size)))
+            train_parts.append(idx[:cut])
+            val_parts.append(idx[cut:])
+        return np.sort(np.concatenate(train_parts)), np.sort(np.concatenate(val_parts))
+    
+    def tokenization_cache_key(self, data_path):
+        """Hash of the training CSV and tokenizer name identifying a tokenized cache entry"""
+        digest = hashlib.sha256(self.model_name.encode('utf-8'))
+        with open(data_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:16]
+    
+    def tokenize_split(self, dataset, cache_name):
+        """Tokenize a split in parallel batches, reusing the on-disk cache when present"""
+        cache_file = None
+        if self.tokenization_cache_dir:
+            os.makedirs(self.tokenization_cache_dir, exist_ok=True)
+            cache_file = os.path.join(self.tokenization_cache_dir, f"{cache_name}.arrow")
+        
+        # Each 1000-row batch goes to the Rust tokenizer in one call, which shards it across
+        # cores itself; a single process avoids pickling the tokenizer into map workers
+        os.environ['TOKENIZERS_PARALLELISM'] = 'true'
+        tokenizer = self.tokenizer
+        tokenized = dataset.map(
+            lambda batch: tokenizer(batch['text'], truncation=True, max_length=512),
+            batched=True,
+            batch_size=1000,
+            remove_columns=['text'],
+            cache_file_name=cache_file,
+            load_from_cache_file=True
+        )
+        tokenized.set_format('torch', columns=['input_ids', 'attention_mask', 'labels'])
+        return tokenized
+    
+    def create_optimizer(self, learning_rate):
+        """AdamW using a single fused (or multi-tensor foreach) update kernel on GPU when available"""
+        optimizer_options = {}
+        if self.device.type == 'cuda':
+            # fused= arrived in torch 2.0; older torch only has foreach=
+            supported = inspect.signature(AdamW).parameters
+            if 'fused' in supported:
+                optimizer_options['fused'] = True
+            elif 'foreach' in supported:
+                optimizer_options['foreach'] = True
+        logger.info(f"AdamW options: {optimizer_options or 'default'}")
+        return AdamW(self.model.parameters(), lr=learning_rate, **optimizer_options)
+    
+    def train(self, train_dataset, val_dataset, epochs=3, batch_size=16, learning_rate=2e-5, fp16=False,
+              gradient_accumulation_steps=1):
         """Train the model"""
-        # Create data loaders
-        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=batch_size)
+        # Mixed precision only applies on GPU; CPU training stays in FP32
+        use_amp = fp16 and self.device.type == 'cuda'
+        self.use_amp = use_amp
+        scaler = torch.cuda.amp.GradScaler(enabled=use_amp and self.amp_dtype == torch.float16)
+        logger.info(f"Mixed precision training: {use_amp}" + (f" ({self.amp_dtype})" if use_amp else ""))
+        # Create data loaders; the collator pads each batch to its longest sequence
+        # (rounded up to a multiple of 8 on GPU so matmul shapes suit tensor cores)
+        collator = DataCollatorWithPadding(
+            tokenizer=self.tokenizer,
+            padding='longest',
+            pad_to_multiple_of=8 if self.device.type == 'cuda' else None
+        )
+        # Batches are collated in worker processes and prefetched while the model trains
+        num_workers = min(4, (os.cpu_count() or 1) // 2)
+        if num_workers > 0:
+            # Forked workers must not start their own tokenizer thread pools on top of each other
+            os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+        loader_options = {
+            'collate_fn': collator,
+            'num_workers': num_workers,
+            'pin_memory': self.device.type == 'cuda'
+        }
+        if num_workers > 0:
+            loader_options.update(persistent_workers=True, prefetch_factor=4)
+        # Shuffle into mega-batches of 50 * batch_size and sort each by length, so batches hold
+        # posts of similar length and short posts aren't padded out to long ones
+        train_lengths = [len(ids) for ids in train_dataset.with_format(None)['input_ids']]
+        train_sampler = LengthGroupedSampler(dataset=train_dataset, batch_size=batch_size, lengths=train_lengths)
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=train_sampler, **loader_options)
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, **loader_options)
         
         # Setup optimizer and scheduler
-        optimizer = AdamW(self.model.parameters(), lr=learning_rate)
-        total_steps = len(train_loader) * epochs
+        optimizer = self.create_optimizer(learning_rate)
+        # The scheduler advances once per optimizer update, not once per microbatch
+        updates_per_epoch = -(-len(train_loader) // gradient_accumulation_steps)
+        total_steps = updates_per_epoch * epochs
+        logger.info(f"Effective batch size: {batch_size * gradient_accumulation_steps}")
         scheduler = get_linear_schedule_with_warmup(
             optimizer,
             num_warmup_steps=0,
@@ -136,33 +285,41 @@ class InformativeEmotionalClassifier:
             
             # Training phase
             self.model.train()
-            total_loss = 0
+            # Summed on the device so the loop never blocks on a GPU->CPU copy per batch
+            total_loss = torch.zeros((), device=self.device)
             
-            train_pbar = tqdm(train_loader, desc="Training")
-            for batch in train_pbar:
-                optimizer.zero_grad()
-                
-                input_ids = batch['input_ids'].to(self.device)
-                attention_mask = batch['attention_mask'].to(self.device)
-                labels = batch['labels'].to(self.device)
+            optimizer.zero_grad(set_to_none=True)
+            # Throttled so container logs aren't flushed on every batch
+            train_batches = CUDAPrefetcher(train_loader, self.device) if self.device.type == 'cuda' else train_loader
+            train_pbar = tqdm(train_batches, desc="Training", mininterval=PROGRESS_MIN_INTERVAL_SECONDS, miniters=50)
+            for step, batch in enumerate(train_pbar, start=1):
+                # No-ops for batches the prefetcher has already placed on the GPU
+                input_ids = batch['input_ids'].to(self.device, non_blocking=True)
+                attention_mask = batch['attention_mask'].to(self.device, non_blocking=True)
+                labels = batch['labels'].to(self.device, non_blocking=True)
                 
-                outputs = self.model(
-                    input_ids=input_ids,
-                    attention_mask=attention_mask,
-                    labels=labels
-                )
+                with torch.cuda.amp.autocast(enabled=use_amp, dtype=self.amp_dtype):
+                    outputs = self.forward_model(
+                        input_ids=input_ids,
+                        attention_mask=attention_mask,
+                        labels=labels
+                    )
                 
                 loss = outputs.loss
-                total_loss += loss.item()
+                total_loss += loss.detach()
                 
-                loss.backward()
-                torch.nn.utils.clip_grad_norm_(self.model.parameters(), 1.0)
-                optimizer.step()
-                scheduler.step()
-                
-                train_pbar.set_postfix({'loss': loss.item()})
+                # Scale the loss so FP16 gradients don't underflow; unscale before clipping.
+                # Gradients accumulate over microbatches; the last partial group still steps.
+                scaler.scale(loss / gradient_accumulation_steps).backward()
+                if step % gradient_accumulation_steps == 0 or step == len(train_loader):
+                    scaler.unscale_(optimizer)
+                    torch.nn.utils.clip_grad_norm_(self.model.parameters(), 1.0)
+                    scaler.step(optimizer)
+                    scaler.update()
+                    scheduler.step()
+                    optimizer.zero_grad(set_to_none=True)
             
-            avg_train_loss = total_loss / len(train_loader)
+            avg_train_loss = total_loss.item() / len(train_loader)
             
             # Validation phase
             val_accuracy = self.evaluate(val_loader)
@@ -180,23 +337,27 @@ class InformativeEmotionalClassifier:
     def evaluate(self, data_loader):
         """Evaluate the model"""
         self.model.eval()
-        predictions = []
-        actual_labels = []
+        num_samples = len(data_loader.dataset)
+        predictions = np.empty(num_samples, dtype=np.int64)
+        actual_labels = np.empty(num_samples, dtype=np.int64)
+        offset = 0
         
-        with torch.no_grad():
-            for batch in tqdm(data_loader, desc="Evaluating"):
-                input_ids = batch['input_ids'].to(self.device)
-                attention_mask = batch['attention_mask'].to(self.device)
-                labels = batch['labels'].to(self.device)
+        # Argmax over two logits is insensitive to reduced precision, so autocast on any GPU
+        with torch.inference_mode(), torch.cuda.amp.autocast(enabled=self.device.type == 'cuda', dtype=self.amp_dtype):
+            for batch in tqdm(data_loader, desc="Evaluating", mininterval=PROGRESS_MIN_INTERVAL_SECONDS):
+                input_ids = batch['input_ids'].to(self.device, non_blocking=True)
+                attention_mask = batch['attention_mask'].to(self.device, non_blocking=True)
                 
-                outputs = self.model(
+                outputs = self.forward_model(
                     input_ids=input_ids,
                     attention_mask=attention_mask
                 )
                 
-                _, predicted = torch.max(outputs.logits, dim=1)
-                predictions.extend(predicted.cpu().tolist())
-                actual_labels.extend(labels.cpu().tolist())
+                # Labels never leave the CPU; only the predicted indices are copied back
+                batch_size = input_ids.size(0)
+                predictions[offset:offset + batch_size] = outputs.logits.argmax(dim=1).cpu().numpy()
+                actual_labels[offset:offset + batch_size] = batch['labels'].numpy()
+                offset += batch_size
         
         accuracy = accuracy_score(actual_labels, predictions)
         
@@ -234,6 +395,26 @@ class InformativeEmotionalClassifier:
         
         logger.info("Model saved successfully")
 
+def export_quantized_onnx(model_dir):
+    """
+    Export the saved model to ONNX and apply INT8 dynamic quantization for CPU inference.
+    Writes onnx/model_quantized.onnx under model_dir, which inference.py prefers on CPU.
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    
+    onnx_dir = os.path.join(model_dir, 'onnx')
+    logger.info(f"Exporting INT8 ONNX model to {onnx_dir}")
+    
+    ort_model = ORTModelForSequenceClassification.from_pretrained(model_dir, export=True)
+    ort_model.save_pretrained(onnx_dir)
+    
+    quantizer = ORTQuantizer.from_pretrained(ort_model)
+    quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=onnx_dir, quantization_config=quantization_config)
+    
+    logger.info("ONNX export completed")
+
 def main():
     """Main training function"""
     parser = argparse.ArgumentParser()
@@ -249,6 +430,11 @@ def main():
     parser.add_argument('--batch-size', type=int, default=16)
     parser.add_argument('--learning-rate', type=float, default=2e-5)
     parser.add_argument('--model-name', type=str, default='distilbert-base-uncased')
+    # /opt/ml/checkpoints is synced to S3 when the estimator sets checkpoint_s3_uri
+    parser.add_argument('--tokenization-cache-dir', type=str, default='/opt/ml/checkpoints/tokenized')
+    parser.add_argument('--export-onnx', type=lambda v: str(v).lower() == 'true', default=False)
+    parser.add_argument('--fp16', type=lambda v: str(v).lower() == 'true', default=False)
+    parser.add_argument('--gradient-accumulation-steps', type=int, default=1)
     
     args = parser.parse_args()
     
@@ -256,7 +442,10 @@ def main():
     logger.info(f"Arguments: {args}")
     
     # Initialize classifier
-    classifier = InformativeEmotionalClassifier(model_name=args.model_name)
+    classifier = InformativeEmotionalClassifier(
+        model_name=args.model_name,
+        tokenization_cache_dir=args.tokenization_cache_dir
+    )
     
     # Find training data file
     train_files = [f for f in os.listdir(args.train) if f.endswith('.csv')]
@@ -275,7 +464,9 @@ def main():
         val_dataset,
         epochs=args.epochs,
         batch_size=args.batch_size,
-        learning_rate=args.learning_rate
+        learning_rate=args.learning_rate,
+        fp16=args.fp16,
+        gradient_accumulation_steps=args.gradient_accumulation_steps
     )
     
     # Log final results
@@ -292,6 +483,10 @@ def main():
     
     with open(os.path.join(args.model_dir, 'training_metrics.json'), 'w') as f:
         json.dump(metrics, f)
+    
+    # Optional INT8 ONNX artifact for CPU endpoints
+    if args.export_onnx:
+        export_quantized_onnx(args.model_dir)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
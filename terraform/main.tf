@@ -121,6 +121,49 @@ resource "aws_iam_role_policy_attachment" "lambda_ingest_attach_bedrock" {
   policy_arn = aws_iam_policy.lambda_ingest_bedrock_policy.arn
 }
 
+# --- DynamoDB Table for Cross-Run Content Deduplication ---
+resource "aws_dynamodb_table" "seen_content_hashes" {
+  name         = "reddit-seen-content-hashes"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "content_hash"
+
+  attribute {
+    name = "content_hash"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Project   = "Alternative Consumer Sentiment Dashboard"
+    ManagedBy = "Terraform"
+  }
+}
+
+resource "aws_iam_policy" "lambda_ingest_dynamodb_policy" {
+  name        = "reddit-ingest-lambda-dynamodb-policy"
+  description = "Policy to allow the ingest Lambda to read and write seen content hashes"
+
+  policy = jsonencode({
+    Version   = "2012-10-17",
+    Statement = [
+      {
+        Action   = ["dynamodb:BatchGetItem", "dynamodb:BatchWriteItem"],
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.seen_content_hashes.arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "lambda_ingest_attach_dynamodb" {
+  role       = aws_iam_role.lambda_ingest_role.name
+  policy_arn = aws_iam_policy.lambda_ingest_dynamodb_policy.arn
+}
+
 resource "aws_iam_role_policy_attachment" "lambda_ingest_policy_logs" {
   role       = aws_iam_role.lambda_ingest_role.name
   policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
@@ -158,8 +201,13 @@ resource "aws_lambda_function" "reddit_ingest" {
       # Bedrock Configuration
       BEDROCK_MODEL_ID   = "anthropic.claude-3-haiku-20240307-v1:0"
       BEDROCK_REGION     = var.aws_region
+      # Enable only with a model that supports Bedrock prompt caching
+      BEDROCK_PROMPT_CACHING = "false"
       # Fallback to disable AI if Bedrock access fails
       ENABLE_AI_RELEVANCE_CHECK = "false"
+      # Cross-run deduplication of already-processed posts
+      SEEN_HASHES_TABLE  = aws_dynamodb_table.seen_content_hashes.name
+      SEEN_HASH_TTL_DAYS = "30"
     }
   }
 
@@ -269,7 +317,8 @@ resource "aws_iam_policy" "lambda_sentiment_policy" {
       },
       {
         Action   = [
-          "comprehend:DetectSentiment"
+          "comprehend:DetectSentiment",
+          "comprehend:BatchDetectSentiment"
         ],
         Effect   = "Allow",
         Resource = "*" # Can be restricted further if needed
@@ -304,6 +353,12 @@ resource "aws_lambda_function" "sentiment_analysis" {
   source_code_hash = data.archive_file.lambda_sentiment_zip.output_base64sha256
   timeout       = 180  # 3 minutes to handle SageMaker serverless cold starts
 
+  # pyarrow + numpy come from the AWS-managed layer; vendoring them would push the direct-upload
+  # zip past Lambda's 50 MB (zipped) / 250 MB (unzipped) limits
+  layers = [
+    "arn:aws:lambda:${data.aws_region.current.name}:336392948345:layer:AWSSDKPandas-Python39:${var.aws_sdk_pandas_layer_version}"
+  ]
+
   environment {
     variables = {
       PROCESSED_BUCKET_NAME             = var.processed_bucket_name
@@ -559,6 +614,11 @@ resource "aws_api_gateway_rest_api" "sentiment_api" {
   name        = "SentimentAnalysisAPI"
   description = "API for querying Reddit sentiment data"
   
+  # Lets API Gateway decode base64 (gzipped) Lambda proxy bodies when the client sends
+  # Accept: application/json; responses with isBase64Encoded = false pass through unchanged.
+  # Kept narrow so MOCK preflights and other request bodies aren't treated as binary.
+  binary_media_types = ["application/json"]
+  
   endpoint_configuration {
     types = ["REGIONAL"]
   }
@@ -625,6 +685,8 @@ resource "aws_api_gateway_integration" "query_options_integration" {
   resource_id = aws_api_gateway_resource.query_resource.id
   http_method = aws_api_gateway_method.query_options_method.http_method
   type        = "MOCK"
+  # Keep the preflight on the text path so request_templates applies
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -713,6 +775,27 @@ resource "aws_iam_role" "lambda_ticker_search_role" {
   })
 }
 
+resource "aws_dynamodb_table" "ticker_search_rate_limits" {
+  name         = "ticker-search-rate-limits"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "rate_key"
+
+  attribute {
+    name = "rate_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Project   = "Alternative Consumer Sentiment Dashboard"
+    ManagedBy = "Terraform"
+  }
+}
+
 resource "aws_iam_policy" "lambda_ticker_search_policy" {
   name        = "ticker-search-lambda-policy"
   description = "Policy for the ticker search Lambda function"
@@ -725,9 +808,14 @@ resource "aws_iam_policy" "lambda_ticker_search_policy" {
         Resource = data.aws_secretsmanager_secret.reddit_api_secret.arn
       },
       {
-        Action   = "comprehend:DetectSentiment",
+        Action   = ["comprehend:DetectSentiment", "comprehend:BatchDetectSentiment"],
         Effect   = "Allow",
         Resource = "*"
+      },
+      {
+        Action   = "dynamodb:UpdateItem",
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.ticker_search_rate_limits.arn
       }
     ]
   })
@@ -762,6 +850,7 @@ resource "aws_lambda_function" "ticker_search" {
   environment {
     variables = {
       REDDIT_SECRET_NAME = var.reddit_secret_name
+      RATE_LIMIT_TABLE   = aws_dynamodb_table.ticker_search_rate_limits.name
     }
   }
 
@@ -799,6 +888,8 @@ resource "aws_api_gateway_integration" "ticker_search_options_integration" {
   resource_id = aws_api_gateway_resource.ticker_search_resource.id
   http_method = aws_api_gateway_method.ticker_search_options_method.http_method
   type        = "MOCK"
+  # Keep the preflight on the text path so request_templates applies
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -82,7 +82,7 @@ resource "aws_iam_role_policy_attachment" "sagemaker_execution_policy_attachment
 # 
 #   primary_container {
 #     # Using PyTorch Deep Learning Container for BERT models
-#     image = "763104351884.dkr.ecr.${data.aws_region.current.name}.amazonaws.com/pytorch-inference:1.12.0-cpu-py38-ubuntu20.04-sagemaker"
+#     image = "763104351884.dkr.ecr.${data.aws_region.current.name}.amazonaws.com/pytorch-inference:2.1.0-cpu-py310-ubuntu20.04-sagemaker"
 #     
 #     # Model artifacts from your training job
 #     model_data_url = "s3://altdata-sagemaker-models/pytorch-training-2025-08-08-02-02-19-803/output/model.tar.gz"
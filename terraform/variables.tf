@@ -73,4 +73,10 @@ variable "sagemaker_model_bucket_name" {
   description = "The name of the S3 bucket for SageMaker model artifacts."
   type        = string
   default     = "altdata-sagemaker-models"
-}
\ No newline at end of file
+}
+
+variable "aws_sdk_pandas_layer_version" {
+  description = "Version of the AWS-managed AWSSDKPandas-Python39 Lambda layer (provides pyarrow and numpy to the sentiment Lambda). Check the latest version for your region in the AWS SDK for pandas docs."
+  type        = number
+  default     = 28
+}